@@ -0,0 +1 @@
+"""Benchmarks for pycomputrac on synthetic Metastock directory trees"""
@@ -0,0 +1,96 @@
+"""Generate synthetic Metastock/Norgate style directory trees
+
+The trees have the same layout as vendor data: directories nested to a
+configurable depth, each holding an EMASTER file indexing up to 255 F*.dat
+files and an XMASTER file indexing any further F*.mwd files, with the data
+stored as MS Basic format floats.  Prices are a seeded random walk so the
+trees are reproducible.
+
+    python -m benchmarks.generate ROOT --symbols 2000 --records 7500
+"""
+
+import os
+import argparse
+import numpy as np
+
+from pycomputrac.computrac import DATA_DTYPE
+from pycomputrac.writer import MetastockWriter
+
+
+def make_dates(num_records, last_date='2024-12-31') -> np.ndarray:
+    """Return the last num_records weekdays up to last_date as M8[D]"""
+    last_date = np.datetime64(last_date, 'D')
+    days = last_date - np.arange(num_records*7//5 + 7)[::-1]
+    weekdays = (days.astype(np.int64) + 3) % 7
+    return days[weekdays < 5][-num_records:]
+
+
+def make_records(num_records, rng) -> np.ndarray:
+    """Return a DATA_DTYPE array of random daily OHLCV data"""
+    dates = make_dates(num_records)
+    close = 50.0*np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+    spread = np.abs(rng.normal(0, 0.005, len(dates)))*close
+    records = np.zeros(shape=len(dates), dtype=DATA_DTYPE)
+    records['date'] = dates
+    records['open'] = close + rng.uniform(-1, 1, len(dates))*spread
+    records['high'] = np.maximum(records['open'], close) + spread
+    records['low'] = np.minimum(records['open'], close) - spread
+    records['close'] = close
+    records['volume'] = rng.integers(1000, 10**7, len(dates))
+    return records
+
+
+def generate_tree(root_dir, num_symbols=1000, num_records=2500, depth=1,
+                  symbols_per_dir=500, seed=0) -> dict:
+    """Generate a synthetic Metastock directory tree
+
+    @param root_dir: The directory to create the tree in
+    @param num_symbols: The total number of symbols
+    @param num_records: The number of daily records of each symbol
+    @param depth: How deeply the data directories are nested under root_dir
+    @param symbols_per_dir: The number of symbols in each data directory, the
+        first 255 are indexed by EMASTER and the rest by XMASTER
+    @param seed: The random seed
+    @return: A summary of what was generated
+    """
+    rng = np.random.default_rng(seed)
+    num_dirs = (num_symbols + symbols_per_dir - 1)//symbols_per_dir
+    num_bytes = 0
+    for dir_num in range(num_dirs):
+        dir_name = os.path.join(root_dir, *['level%d' % level
+                                            for level in range(depth - 1)])
+        dir_name = os.path.join(dir_name, 'data%03d' % dir_num)
+        os.makedirs(dir_name, exist_ok=True)
+        first_sym = dir_num*symbols_per_dir
+        last_sym = min(num_symbols, first_sym + symbols_per_dir)
+        for master_name in ('EMASTER', 'XMASTER'):
+            if os.path.exists(os.path.join(dir_name, master_name)):
+                os.remove(os.path.join(dir_name, master_name))
+        writer = MetastockWriter(dir_name)
+        for sym_num in range(first_sym, last_sym):
+            file_name = writer.add('SYM%05d' % sym_num,
+                                   make_records(num_records, rng),
+                                   'Synthetic Asset %05d' % sym_num)
+            num_bytes += os.path.getsize(file_name)
+        writer.flush()
+    return {'root_dir': root_dir, 'num_symbols': num_symbols,
+            'num_records': num_records, 'depth': depth,
+            'num_dirs': num_dirs, 'data_bytes': num_bytes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('root_dir')
+    parser.add_argument('--symbols', type=int, default=1000)
+    parser.add_argument('--records', type=int, default=2500)
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--symbols-per-dir', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    summary = generate_tree(args.root_dir, args.symbols, args.records,
+                            args.depth, args.symbols_per_dir, args.seed)
+    print(summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""Time each stage of reading a Metastock directory tree
+
+Stages are timed separately: the find_files directory scan, [ex]master
+parsing, building the catalog, decoding a single data file and decoding
+every data file one after another and with get_many.  Each stage is run
+--repeat times and the best time is kept.  Throughput is reported in
+records/sec and MB/sec and the results can be written to a JSON report and
+compared with a report from another version.  Only the API of the first
+release of pycomputrac is used, so any version can be timed by putting it
+first on the path; versions without get_many time a sequential loop in its
+place.  Generating a tree needs the current version.
+
+    python -m benchmarks.run ROOT --json new.json --compare old.json
+    python -m benchmarks.run --generate /tmp/bench --symbols 2000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+
+import pycomputrac
+from pycomputrac.computrac import ComputracDir
+
+EMASTER_GLOB = '[Ee][Mm][Aa][Ss][Tt][Ee][Rr]'
+XMASTER_GLOB = '[Xx][Mm][Aa][Ss][Tt][Ee][Rr]'
+
+DATA_RECORD_LEN = 28
+"""The size of a data record and of the data file header
+
+Not imported from pycomputrac since older versions do not export it.
+"""
+
+
+def best_time(func, repeat, setup=None):
+    """Return (best wall time in seconds, last result) of repeat calls
+
+    If setup is given it is called untimed before each call and its result
+    passed to func.
+    """
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def stage_result(seconds, records, num_bytes) -> dict:
+    """Return a stage's timing and throughput"""
+    return {'seconds': seconds,
+            'records': records,
+            'bytes': num_bytes,
+            'records_per_sec': records/seconds if seconds > 0 else None,
+            'mb_per_sec': num_bytes/seconds/2**20 if seconds > 0 else None}
+
+
+def run_benchmarks(root_dir, repeat=3, workers=None) -> dict:
+    """Time each stage of reading root_dir
+
+    @param root_dir: The root of a Metastock directory tree
+    @param repeat: The number of times each stage is run
+    @param workers: The maximum number of concurrent loads for get_many
+    @return: A dict of stage name to timing and throughput
+    """
+    stages = {}
+    scanner = ComputracDir()
+
+    def scan():
+        return (scanner.find_files(root_dir, EMASTER_GLOB),
+                scanner.find_files(root_dir, XMASTER_GLOB))
+
+    seconds, (emaster_names, xmaster_names) = best_time(scan, repeat)
+    master_names = emaster_names + xmaster_names
+    stages['find_files'] = stage_result(seconds, len(master_names), 0)
+
+    def parse():
+        computrac_dir = ComputracDir()
+        for emaster_name in emaster_names:
+            computrac_dir.read_emaster_file(emaster_name)
+        for xmaster_name in xmaster_names:
+            computrac_dir.read_xmaster_file(xmaster_name)
+        return computrac_dir
+
+    seconds, computrac_dir = best_time(parse, repeat)
+    master_bytes = sum(os.path.getsize(name) for name in master_names)
+    stages['master_parse'] = stage_result(seconds, len(computrac_dir.tickers),
+                                          master_bytes)
+
+    # A fresh ComputracDir each time since newer versions cache the catalog
+    seconds, items = best_time(lambda fresh_dir: fresh_dir.catalog, repeat,
+                               parse)
+    stages['catalog'] = stage_result(seconds, len(items), 0)
+
+    tickers = list(computrac_dir.tickers)
+    file_sizes = {ticker: os.path.getsize(
+            computrac_dir.get_reference_data(ticker)[5]) for ticker in tickers}
+    total_bytes = sum(file_sizes.values())
+    total_records = sum(size//DATA_RECORD_LEN - 1
+                        for size in file_sizes.values())
+
+    largest = max(tickers, key=file_sizes.get)
+    seconds, data = best_time(lambda: computrac_dir.get_raw_data(largest),
+                              repeat)
+    stages['decode_single'] = stage_result(seconds, len(data),
+                                           file_sizes[largest])
+
+    seconds, _ = best_time(
+            lambda: [computrac_dir.get_raw_data(ticker) for ticker in tickers],
+            repeat)
+    stages['decode_sequential'] = stage_result(seconds, total_records,
+                                               total_bytes)
+
+    if hasattr(computrac_dir, 'get_many'):
+        def get_many():
+            return computrac_dir.get_many(tickers, workers=workers)
+    else:
+        def get_many():
+            return [computrac_dir.get_raw_data(ticker) for ticker in tickers]
+    seconds, _ = best_time(get_many, repeat)
+    stages['decode_get_many'] = stage_result(seconds, total_records,
+                                             total_bytes)
+    return stages
+
+
+def make_report(root_dir, stages, args) -> dict:
+    """Return a JSON serializable report of a benchmark run"""
+    return {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'root_dir': os.path.abspath(root_dir),
+            'pycomputrac': os.path.dirname(pycomputrac.__file__),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'workers': args.workers,
+            'stages': stages}
+
+
+def print_report(report, baseline=None, out=sys.stdout) -> None:
+    """Print a report, with the speedup over a baseline report if given"""
+    header = '%-18s %10s %14s %10s' % ('stage', 'seconds', 'records/sec',
+                                       'MB/sec')
+    if baseline is not None:
+        header += ' %9s' % 'speedup'
+    print(header, file=out)
+    for name, stage in report['stages'].items():
+        line = '%-18s %10.4f %14s %10s' % (
+                name, stage['seconds'],
+                '%.0f' % stage['records_per_sec']
+                if stage['records_per_sec'] else '-',
+                '%.1f' % stage['mb_per_sec'] if stage['bytes'] else '-')
+        if baseline is not None and name in baseline['stages']:
+            line += ' %8.2fx' % (baseline['stages'][name]['seconds'] /
+                                 stage['seconds'])
+        print(line, file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('root_dir', nargs='?',
+                        help='an existing Metastock directory tree')
+    parser.add_argument('--generate', metavar='DIR',
+                        help='generate a synthetic tree in DIR and use it')
+    parser.add_argument('--symbols', type=int, default=1000)
+    parser.add_argument('--records', type=int, default=2500)
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--json', metavar='FILE',
+                        help='write the report to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare with the report in FILE')
+    args = parser.parse_args(argv)
+
+    root_dir = args.root_dir
+    if args.generate is not None:
+        from .generate import generate_tree
+        generate_tree(args.generate, args.symbols, args.records, args.depth)
+        root_dir = args.generate
+    if root_dir is None:
+        parser.error('give a root_dir or --generate DIR')
+
+    report = make_report(root_dir, run_benchmarks(root_dir, args.repeat,
+                                                  args.workers), args)
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+    if args.json is not None:
+        with open(args.json, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
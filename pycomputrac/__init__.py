@@ -1 +1 @@
-from .computrac import ComputracDir
\ No newline at end of file
+from .computrac import ComputracDir, MappedData
@@ -0,0 +1,94 @@
+"""Command line tools for Computrac/Metastock data
+
+    python -m pycomputrac export ROOT OUT_DIR --format csv
+    python -m pycomputrac export ROOT OUT_DIR --format npz --match 'BHP*' \\
+        --start 2020-01-01 --fields date,close,volume --workers 8
+"""
+
+import sys
+import argparse
+
+from .computrac import ComputracDir, DATA_DTYPE
+from .export import EXPORT_FORMATS, Exporter, ExportProgress
+
+
+def export_command(args) -> int:
+    """Run the export command, returning the exit status"""
+    computrac_dir = ComputracDir(args.root_dir, index_cache=args.index_cache)
+    tickers = list(args.tickers)
+    for pattern in args.match:
+        tickers.extend(computrac_dir.match_tickers(pattern))
+    if not tickers and not args.match:
+        tickers = list(computrac_dir.tickers)
+    tickers = list(dict.fromkeys(str(ticker) for ticker in tickers))
+    fields = None
+    if args.fields is not None:
+        fields = [field.strip() for field in args.fields.split(',')]
+
+    exporter = Exporter(computrac_dir, args.out_dir, args.format,
+                        start=args.start, end=args.end, fields=fields,
+                        dtype=args.dtype, chunk_records=args.chunk_records)
+    progress = ExportProgress(len(tickers),
+                              out=None if args.quiet else sys.stderr,
+                              interval=args.progress_interval)
+    errors = {}
+    exporter.export(tickers, workers=args.workers,
+                    processes=args.processes, errors=errors,
+                    progress=progress)
+    for ticker, exc in errors.items():
+        print("Failed to export %s: %s" % (ticker, exc), file=sys.stderr)
+    return 1 if errors else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='pycomputrac',
+                                     description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser(
+            'export', help='export data to CSV, NumPy or HDF5 files',
+            description='Export tickers, by default all of them, to CSV or '
+                        '.npy files per ticker or a single .npz or HDF5 '
+                        'file.  Progress and throughput are reported on '
+                        'stderr.')
+    export.add_argument('root_dir', help='the root of the Metastock data')
+    export.add_argument('out_dir', help='the directory to export to')
+    export.add_argument('tickers', nargs='*', help='tickers to export')
+    export.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    export.add_argument('--match', action='append', default=[],
+                        metavar='PATTERN',
+                        help='also export tickers matching a wildcard '
+                             'pattern, may be repeated')
+    export.add_argument('--start', help='the first date, YYYY-MM-DD')
+    export.add_argument('--end', help='the last date, YYYY-MM-DD')
+    export.add_argument('--fields',
+                        help='comma separated fields to export from %s' %
+                             ','.join(DATA_DTYPE.names))
+    export.add_argument('--dtype', choices=('float32', 'float64'),
+                        default='float32')
+    export.add_argument('--workers', type=int, default=None)
+    export.add_argument('--processes', action='store_true',
+                        help='use worker processes instead of threads, '
+                             'for CPU bound formats such as CSV')
+    export.add_argument('--chunk-records', type=int, default=65536)
+    export.add_argument('--index-cache', metavar='FILE',
+                        help='cache the directory index in FILE')
+    export.add_argument('--progress-interval', type=float, default=1.0,
+                        metavar='SECONDS')
+    export.add_argument('--quiet', action='store_true',
+                        help='do not report progress')
+    export.set_defaults(func=export_command)
+
+    # argparse fills the tickers before reading any options, so tickers
+    # given after an option are left over.  parse_intermixed_args does not
+    # support subcommands, so they are added here.
+    args, extras = parser.parse_known_args(argv)
+    unknown = [arg for arg in extras if arg.startswith('-')]
+    if unknown:
+        export.error('unrecognized arguments: %s' % ' '.join(unknown))
+    args.tickers.extend(extras)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import asyncio
+import warnings
+import functools
+import concurrent.futures
+import numpy as np
+
+from .computrac import ComputracDir
+
+
+class AsyncComputracDir(object):
+    """
+    An asyncio facade over a ComputracDir.
+
+    File I/O and decoding run on a bounded thread pool so the event loop is
+    never blocked by a large file.  Concurrent requests for the same data are
+    coalesced into a single load whose result is shared by all the callers,
+    so treat the arrays returned as read only.  Each call takes an optional
+    timeout; a caller which times out or is cancelled stops waiting without
+    cancelling the load other callers are waiting for.
+
+    """
+
+    def __init__(self, computrac_dir, max_workers=None, executor=None):
+        """
+        @param computrac_dir: The ComputracDir to serve data from
+        @param max_workers: The size of the thread pool used for loads
+        @param executor: An executor to use instead of creating a thread pool.
+            It is not shut down by close.
+        """
+        self.computrac_dir = computrac_dir
+        self._own_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self._executor = executor
+        self._pending = {}
+
+    @classmethod
+    async def open(cls, root_dir, max_workers=None, **kwargs):
+        """Open a directory of Computrac data without blocking the event loop
+
+        @param root_dir: The root directory which contains all Computrac data
+        @param max_workers: The size of the thread pool used for loads
+        @param kwargs: Passed on to ComputracDir
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        try:
+            computrac_dir = await asyncio.get_running_loop().run_in_executor(
+                    executor, functools.partial(ComputracDir, root_dir,
+                                                **kwargs))
+        except BaseException:
+            executor.shutdown(wait=False)
+            raise
+        async_dir = cls(computrac_dir, executor=executor)
+        async_dir._own_executor = True
+        return async_dir
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """Shut down the thread pool if it was created by this object"""
+        if self._own_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def catalog(self):
+        """The catalog of the underlying ComputracDir"""
+        return self.computrac_dir.catalog
+
+    @property
+    def tickers(self):
+        """The tickers of the underlying ComputracDir"""
+        return self.computrac_dir.tickers
+
+    def _load(self, key, func, *args):
+        """Start a load in the executor, or join one already in progress"""
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(
+                    self._executor, functools.partial(func, *args))
+            self._pending[key] = future
+
+            def load_done(done):
+                self._pending.pop(key, None)
+                if not done.cancelled():
+                    # Mark the exception retrieved even if no caller waits
+                    done.exception()
+
+            future.add_done_callback(load_done)
+        return future
+
+    async def get_raw_data(self, asset_id, start=None, end=None, fields=None,
+                           dtype='float', columnar=False, timeout=None):
+        """Return the underlying data given the name or ticker of an asset
+
+        See ComputracDir.get_raw_data.
+        @param asset_id: may be a ticker or an asset name
+        @param start: If given, the first date (inclusive) to return.
+        @param end: If given, the last date (inclusive) to return.
+        @param fields: If given, return only these fields.
+        @param dtype: The float type of the price and volume fields.
+        @param columnar: If True return a dict of field name to array.
+        @param timeout: If given, seconds to wait before raising TimeoutError
+        """
+        key = (asset_id, start, end,
+               None if fields is None else tuple(fields),
+               np.dtype(dtype).str, columnar)
+        future = self._load(key, self.computrac_dir.get_raw_data, asset_id,
+                            start, end, fields, dtype, columnar)
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    async def get_many(self, asset_ids, start=None, end=None, fields=None,
+                       dtype='float', columnar=False, timeout=None,
+                       errors=None):
+        """Load the data for many assets concurrently and return a dict
+
+        Assets which fail to load, including those which time out, are left
+        out of the dict returned and reported as in ComputracDir.get_many.
+        @param asset_ids: An iterable of tickers or asset names
+        @param start: If given, the first date (inclusive) to return.
+        @param end: If given, the last date (inclusive) to return.
+        @param fields: If given, return only these fields.
+        @param dtype: The float type of the price and volume fields.
+        @param columnar: If True return dicts of field name to array.
+        @param timeout: If given, seconds to wait for each asset
+        @param errors: An optional dict to collect failures in.
+        @return: A dict of asset_id to data array.
+        """
+        asset_ids = list(dict.fromkeys(asset_ids))
+        loaded = await asyncio.gather(
+                *[self.get_raw_data(asset_id, start, end, fields, dtype,
+                                    columnar, timeout)
+                  for asset_id in asset_ids], return_exceptions=True)
+        results = {}
+        for asset_id, data in zip(asset_ids, loaded):
+            if not isinstance(data, BaseException):
+                results[asset_id] = data
+            elif isinstance(data, asyncio.CancelledError):
+                raise data
+            elif errors is not None:
+                errors[asset_id] = data
+            else:
+                warnings.warn("Failed to load %s: %s" % (asset_id, data))
+        return results
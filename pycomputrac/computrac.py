@@ -1,10 +1,44 @@
 import os
+import re
 import fnmatch
 import struct
+import pickle
 import datetime
+import tempfile
+import time
+import warnings
+import threading
+import contextlib
+import collections
+import concurrent.futures
 import numpy as np
 
 
+INDEX_CACHE_VERSION = 2
+"""Version of the index cache file format, see ComputracDir.index_cache"""
+
+REFDATA_DTYPE = np.dtype([('ticker',      object),
+                          ('name',        object),
+                          ('start',       'M8[D]'),
+                          ('end',         'M8[D]'),
+                          ('freq',        'U1'),
+                          ('file_name',   object),
+                          ('num_fld',     'u1'),
+                          ('flag',        'U1'),
+                          ('master_file', object)])
+"""The columnar reference data read from [ex]master files, one row per asset
+
+A row converts to the tuple returned by ComputracDir.get_reference_data.
+"""
+
+CATALOG_DTYPE = np.dtype([('ticker', 'S32'),
+                          ('name',   'S256'),
+                          ('freq',   'S1'),
+                          ('start',  'M8[D]'),
+                          ('end',    'M8[D]')])
+"""The dtype of the catalog of symbols, see ComputracDir.catalog"""
+
+
 def strip_null(c_string, null=b'\x00'):
     """Strip everything past the first null in a string
 
@@ -18,6 +52,46 @@ def strip_null(c_string, null=b'\x00'):
     return c_string[0:end_idx]
 
 
+def strip_null_array(c_strings) -> list:
+    """Vectorized strip_null for a column of fixed width strings
+
+    Returns the same strings strip_null followed by decode() would for each
+    row, including dropping the last character of a string with no null.
+    @param c_strings: An (n, width) array of uint8, one string per row
+    """
+    c_strings = np.asarray(c_strings, dtype=np.uint8)
+    width = c_strings.shape[1]
+    is_null = (0 == c_strings)
+    end_idx = np.where(is_null.any(axis=1), is_null.argmax(axis=1), width - 1)
+    c_strings = np.where(np.arange(width) < end_idx[:, np.newaxis], c_strings,
+                         0).astype(np.uint8)
+    return np.char.decode(c_strings.view('S%d' % width).ravel()).tolist()
+
+
+def lookup_ticker(asset_id, tickers, name_tickers) -> str:
+    """Return the ticker of an asset given its ticker or name
+
+    @param asset_id: May be a ticker or asset name
+    @param tickers: A container of all the tickers
+    @param name_tickers: A dict of asset name to the list of its tickers
+    """
+    if asset_id in tickers:
+        return asset_id
+    elif asset_id in name_tickers:
+        tickers_list = name_tickers[asset_id]
+        if len(tickers_list) == 1:
+            return tickers_list[0]
+        else:
+            multi_ticker_str = " - ".join(tickers_list)
+            raise LookupError(
+                    "Multiple Tickers correspond to Name %s, Tickers: %s" %
+                    (asset_id, multi_ticker_str))
+    else:
+        raise LookupError(
+                "Asset ID: %s does not correspond to any ticker or name." %
+                asset_id)
+
+
 def date2string(dt: datetime.date) -> str:
     """Returns a string YYYY-MM-DD given a datetime.date object
 
@@ -116,14 +190,622 @@ def fmsbin2ieee(ms_bin) -> float:
     return struct.unpack("f", bytes(ieee))[0]
 
 
+def fmsbin2ieee_array(ms_bin) -> np.ndarray:
+    """Convert an array of MS Basic format floats to IEEE format floats
+
+    Vectorized version of fmsbin2ieee.  Each element of ms_bin holds the 4
+    raw bytes of one MS Basic format float read as a little endian uint32,
+    i.e. the exponent is in the high byte and the sign bit is bit 23.  The
+    bit manipulation mirrors fmsbin2ieee exactly, including the handling of
+    a zero exponent, so the results are bit for bit identical.
+    @param ms_bin: An array of uint32 containing MS Basic format floats.
+    @return: An array of float32 with the same shape as ms_bin.
+    """
+    ms_bin = np.asarray(ms_bin, dtype='<u4')
+
+    # Simplified from exponent-1-128+127
+    ieee_exp = (ms_bin >> 24).astype(np.int32) - 2
+
+    # Sign moves from bit 23 to bit 31, the 23 mantissa bits stay put
+    ieee = (ms_bin & 0x7fffff) | ((ms_bin & 0x800000) << 8)
+    ieee |= ((ieee_exp >> 1) & 0xff).astype(np.uint32) << 24
+    ieee |= ((ieee_exp << 7) & 0x80).astype(np.uint32) << 16
+
+    # Any ms_binary with 0 exponent is 0
+    ieee[ieee_exp == -2] = 0
+    return ieee.view('<f4')
+
+
+def fmsfloat2datetime64(ms_dates) -> np.ndarray:
+    """Convert an array of metastock format date floats into datetime64[D]
+
+    Vectorized version of fmsfloat2date.  The date arithmetic is done on the
+    integer YYYYMMDD value so no python date objects are created.  Like
+    fmsfloat2date a zero date maps to 1900-01-01 and an invalid date raises
+    ValueError.
+    @param ms_dates: An array of floats representing metastock dates.
+    """
+    ms_dates = np.asarray(ms_dates, dtype=np.float64)
+    if not np.isfinite(ms_dates).all():
+        raise ValueError("cannot convert non finite metastock date")
+    yyyymmdd = (ms_dates + 19000000).astype(np.int64)
+    yyyymmdd[19000000 == yyyymmdd] = 19000101
+    return yyyymmdd2datetime64(yyyymmdd)
+
+
+def yyyymmdd2datetime64(yyyymmdd) -> np.ndarray:
+    """Convert an array of integer YYYYMMDD dates into datetime64[D]
+
+    Raises ValueError if any of the dates is invalid.
+    @param yyyymmdd: An array of integers
+    """
+    yyyymmdd = np.asarray(yyyymmdd, dtype=np.int64)
+    yyyy = yyyymmdd // 10000
+    mm = (yyyymmdd - (yyyy*10000)) // 100
+    dd = yyyymmdd % 100
+    if ((yyyy < 1) | (yyyy > 9999) | (mm < 1) | (mm > 12) | (dd < 1)).any():
+        raise ValueError("invalid metastock date")
+    months = ((yyyy - 1970)*12 + mm - 1).astype('M8[M]')
+    dates = months.astype('M8[D]') + (dd - 1)
+    if (dates >= (months + 1).astype('M8[D]')).any():
+        raise ValueError("day is out of range for month")
+    return dates
+
+
+class Stats(object):
+    """
+    Counters and cumulative per-stage wall times for a ComputracDir.
+
+    Counters are incremented with count and stage times accumulated with
+    add_time or the timer context manager.  Every update is also passed to
+    any hooks added with add_hook, as hook(kind, name, value) with kind
+    'count' or 'time', so metrics can be forwarded to external monitoring.
+    The stages are 'scan' (directory walk), 'master_parse', 'catalog',
+    'read' (data file I/O) and 'decode' (MBF decoding).
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._seconds = {}
+        self._hooks = []
+
+    def add_hook(self, hook) -> None:
+        """Call hook(kind, name, value) on every update"""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook) -> None:
+        """Stop calling a hook added with add_hook"""
+        self._hooks.remove(hook)
+
+    def count(self, name, value=1) -> None:
+        """Add value to the counter name"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        for hook in self._hooks:
+            hook('count', name, value)
+
+    def add_time(self, stage, seconds) -> None:
+        """Add seconds to the wall time of stage"""
+        with self._lock:
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+        for hook in self._hooks:
+            hook('time', stage, seconds)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Context manager adding the time spent in the block to stage"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start_time)
+
+    def snapshot(self) -> dict:
+        """Return a copy of the counters and stage times"""
+        with self._lock:
+            return {'counters': dict(self._counters),
+                    'seconds': dict(self._seconds)}
+
+    def reset(self) -> None:
+        """Set all counters and stage times back to zero"""
+        with self._lock:
+            self._counters.clear()
+            self._seconds.clear()
+
+
+DATA_HEADER_FMT = "H H 24x"
+"""Format string for the header of a 7 field data file
+totalRecords: ushort = Not used by metastock itself
+lastRecord: ushort = The last record in the file
+24 blanks
+"""
+
+DATA_RECORD_FMT = "f f f f f f f"
+"""Format string for a 7 field metastock data record
+All floats, no padding, but the floats are in MS Basic format not
+IEEE format so you can't use struct unpack with the record_fmt as a
+format string.  Instead use the function fmsbin2ieee with the relevant
+4 raw bytes as an argument, or fmsbin2ieee_array for whole columns.
+date, open, high, low, close, volume, openInterest
+"""
+
+DATA_RECORD_LEN = struct.calcsize(DATA_RECORD_FMT)
+
+DATA_DTYPE = np.dtype([('date',          'M8[D]'),
+                       ('open',          'float'),
+                       ('high',          'float'),
+                       ('low',           'float'),
+                       ('close',         'float'),
+                       ('volume',        'float'),
+                       ('open_interest', 'float')])
+"""The dtype of the array returned for each asset by ComputracDir"""
+
+
+def data_dtype(fields=None, dtype='float') -> np.dtype:
+    """Return the dtype of decoded data for a projection and float precision
+
+    @param fields: The names of the fields (from DATA_DTYPE) to include, all
+        of them if None.
+    @param dtype: The float type of the price and volume fields.  The data is
+        float32 on disk, so float32 loses nothing and halves the memory.
+    """
+    if fields is None:
+        fields = DATA_DTYPE.names
+    if 'f' != np.dtype(dtype).kind:
+        raise ValueError("dtype must be a float type, not %s" % dtype)
+    for field in fields:
+        if field not in DATA_DTYPE.names:
+            raise ValueError("No field %s in metastock data" % field)
+    return np.dtype([(field, DATA_DTYPE[field] if 'date' == field else dtype)
+                     for field in fields])
+
+
+def decode_data_records(words, fields=None, dtype='float', columnar=False):
+    """Decode raw metastock data records into a structured array
+
+    Only the fields asked for are decoded.
+    @param words: A (num_records, 7) array of uint32, the raw MS Basic format
+        fields of each record.
+    @param fields: The names of the fields to decode, all of them if None.
+    @param dtype: The float type of the price and volume fields.
+    @param columnar: If True return a dict of field name to a contiguous
+        array instead of one structured array.
+    @return: A structured array of dtype DATA_DTYPE when called with the
+        default arguments, see data_dtype.
+    """
+    words = np.asarray(words, dtype='<u4').reshape(-1, len(DATA_DTYPE))
+    out_dtype = data_dtype(fields, dtype)
+    if columnar:
+        ohlc_data = {}
+    else:
+        ohlc_data = np.empty(shape=len(words), dtype=out_dtype)
+    for field in out_dtype.names:
+        values = fmsbin2ieee_array(words[:, DATA_DTYPE.names.index(field)])
+        if 'date' == field:
+            values = fmsfloat2datetime64(values)
+        if columnar:
+            ohlc_data[field] = values.astype(out_dtype[field], copy=False)
+        else:
+            ohlc_data[field] = values
+    return ohlc_data
+
+
+def project_data(data, fields=None, dtype='float', columnar=False):
+    """Project already decoded data as decode_data_records would
+
+    @param data: A structured array of dtype DATA_DTYPE
+    @param fields: The names of the fields to keep, all of them if None.
+    @param dtype: The float type of the price and volume fields.
+    @param columnar: If True return a dict of field name to a contiguous
+        array instead of one structured array.
+    """
+    out_dtype = data_dtype(fields, dtype)
+    if columnar:
+        return {field: np.ascontiguousarray(data[field],
+                                            dtype=out_dtype[field])
+                for field in out_dtype.names}
+    ohlc_data = np.empty(shape=len(data), dtype=out_dtype)
+    for field in out_dtype.names:
+        ohlc_data[field] = data[field]
+    return ohlc_data
+
+
+def read_data_header(datafile) -> int:
+    """Read the header of an open data file and return the number of records
+
+    The header occupies the first record slot and its lastRecord field counts
+    itself, so the number of data records is one less than lastRecord.
+    @param datafile: A data file opened in binary mode, positioned at the
+        start of the file.
+    """
+    header_len = struct.calcsize(DATA_HEADER_FMT)
+    assert(header_len == DATA_RECORD_LEN)
+    buf = datafile.read(header_len)
+    (junk, num_records) = struct.unpack(DATA_HEADER_FMT, buf)
+    return max(num_records - 1, 0)
+
+
+def date2fmsfloat(dt) -> float:
+    """Convert a date into a metastock format date float
+
+    The inverse of fmsfloat2date.
+    @param dt: a datetime.date, numpy datetime64 or 'YYYY-MM-DD' string
+    """
+    dt = np.datetime64(dt, 'D').astype(datetime.date)
+    return float(dt.year*10000 + dt.month*100 + dt.day - 19000000)
+
+
+def find_record(datafile, num_records, dt, side='left') -> int:
+    """Binary search the date column of an open data file
+
+    Data records are stored in date order so the record for a date can be
+    found by seeking to record offsets and reading only the 4 byte date
+    field, without reading or decoding the rest of the file.  Like
+    numpy.searchsorted, 'left' returns the index of the first record on or
+    after dt and 'right' the index of the first record after dt.  Raises
+    ValueError if the file holds fewer than num_records records.
+    @param datafile: A data file opened in binary mode
+    @param num_records: The number of data records, see read_data_header
+    @param dt: The date to search for, anything accepted by date2fmsfloat
+    @param side: 'left' or 'right'
+    """
+    if side not in ('left', 'right'):
+        raise ValueError("side must be 'left' or 'right', not %s" % side)
+    ms_date = date2fmsfloat(dt)
+    lo, hi = 0, num_records
+    while lo < hi:
+        mid = (lo + hi)//2
+        datafile.seek(DATA_RECORD_LEN*(mid + 1))
+        buf = datafile.read(4)
+        if len(buf) != 4:
+            raise ValueError("%s is truncated: expected %d records" %
+                             (getattr(datafile, 'name', 'data file'),
+                              num_records))
+        rec_date = fmsbin2ieee(buf)
+        if rec_date < ms_date or ('right' == side and rec_date == ms_date):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def find_record_range(datafile, start=None, end=None):
+    """Return the range of records of an open data file within a date range
+
+    @param datafile: A data file opened in binary mode, positioned at the
+        start of the file.
+    @param start: If given, the first date (inclusive) of the range.
+    @param end: If given, the last date (inclusive) of the range.
+    @return: (first_rec, last_rec), the records in range are
+        first_rec <= rec < last_rec
+    """
+    num_records = read_data_header(datafile)
+    first_rec, last_rec = 0, num_records
+    if end is not None:
+        last_rec = find_record(datafile, num_records, end, 'right')
+    if start is not None:
+        first_rec = find_record(datafile, last_rec, start, 'left')
+    return first_rec, max(first_rec, last_rec)
+
+
+def _decode_buffer(buf, fields, dtype, columnar, stats):
+    """decode_data_records on bytes read from a file, counting in stats"""
+    if stats is None:
+        return decode_data_records(np.frombuffer(buf, dtype='<u4'), fields,
+                                   dtype, columnar)
+    start_time = time.perf_counter()
+    data = decode_data_records(np.frombuffer(buf, dtype='<u4'), fields,
+                               dtype, columnar)
+    stats.add_time('decode', time.perf_counter() - start_time)
+    stats.count('records_decoded', len(buf)//DATA_RECORD_LEN)
+    return data
+
+
+def _count_read(stats, start_time, num_bytes) -> None:
+    """Count a data file read which started at start_time in stats"""
+    stats.add_time('read', time.perf_counter() - start_time)
+    stats.count('files_read')
+    stats.count('bytes_read', num_bytes)
+
+
+def read_data_file(file_name, start=None, end=None, fields=None,
+                   dtype='float', columnar=False, stats=None):
+    """Read and decode a metastock F*.dat or F*.mwd data file
+
+    The records are read with a single call and decoded with vectorized numpy
+    operations instead of record by record.  If start or end are given only
+    the records in the date range are read, located by binary search of the
+    on disk date column (see find_record).
+    @param file_name: FQ name of the data file.
+    @param start: If given, the first date (inclusive) to return.
+    @param end: If given, the last date (inclusive) to return.
+    @param fields: If given, decode only these fields, see data_dtype.
+    @param dtype: The float type of the price and volume fields.
+    @param columnar: If True return a dict of field name to array.
+    @param stats: If given, a Stats to count the I/O and decoding in.
+    @return: A structured array of dtype DATA_DTYPE when called with the
+        default arguments, see decode_data_records.
+    """
+    start_time = time.perf_counter() if stats is not None else 0
+    with open(file_name, 'rb') as datafile:
+        first_rec, last_rec = find_record_range(datafile, start, end)
+        num_records = last_rec - first_rec
+        datafile.seek(DATA_RECORD_LEN*(first_rec + 1))
+        buf = datafile.read(num_records*DATA_RECORD_LEN)
+    if stats is not None:
+        _count_read(stats, start_time, len(buf))
+    if len(buf) != num_records*DATA_RECORD_LEN:
+        raise ValueError("%s is truncated: expected %d records" %
+                         (file_name, last_rec))
+    return _decode_buffer(buf, fields, dtype, columnar, stats)
+
+
+def read_data_asof(file_name, dt, fields=None, dtype='float', stats=None):
+    """Read the last record of a data file on or before a date
+
+    The record is found by binary search of the on disk date column and is
+    the only record read and decoded.
+    @param file_name: FQ name of the data file.
+    @param dt: The date, anything accepted by date2fmsfloat
+    @param fields: If given, decode only these fields, see data_dtype.
+    @param dtype: The float type of the price and volume fields.
+    @param stats: If given, a Stats to count the I/O and decoding in.
+    @return: A structured array with one record, or no records if the file
+        has none on or before dt.
+    """
+    start_time = time.perf_counter() if stats is not None else 0
+    with open(file_name, 'rb') as datafile:
+        num_records = read_data_header(datafile)
+        rec = find_record(datafile, num_records, dt, 'right') - 1
+        buf = b''
+        if rec >= 0:
+            datafile.seek(DATA_RECORD_LEN*(rec + 1))
+            buf = datafile.read(DATA_RECORD_LEN)
+    if stats is not None:
+        _count_read(stats, start_time, len(buf))
+    return _decode_buffer(buf, fields, dtype, False, stats)
+
+
+def iter_data_file(file_name, chunk_records=65536, start=None, end=None,
+                   fields=None, dtype='float', columnar=False, stats=None):
+    """Read and decode a data file in fixed size chunks
+
+    A generator yielding structured arrays of dtype DATA_DTYPE of at most
+    chunk_records records each, so memory use is bounded whatever the size
+    of the file.  Concatenating the chunks gives the same array as
+    read_data_file.
+    @param file_name: FQ name of the data file.
+    @param chunk_records: The maximum number of records in each chunk.
+    @param start: If given, the first date (inclusive) to return.
+    @param end: If given, the last date (inclusive) to return.
+    @param fields: If given, decode only these fields, see data_dtype.
+    @param dtype: The float type of the price and volume fields.
+    @param columnar: If True yield dicts of field name to array.
+    @param stats: If given, a Stats to count the I/O and decoding in.
+    """
+    data_dtype(fields, dtype)
+    if chunk_records < 1:
+        raise ValueError("chunk_records must be positive")
+    with open(file_name, 'rb') as datafile:
+        first_rec, last_rec = find_record_range(datafile, start, end)
+        datafile.seek(DATA_RECORD_LEN*(first_rec + 1))
+        for chunk_start in range(first_rec, last_rec, chunk_records):
+            num_records = min(chunk_records, last_rec - chunk_start)
+            start_time = time.perf_counter() if stats is not None else 0
+            buf = datafile.read(num_records*DATA_RECORD_LEN)
+            if stats is not None:
+                _count_read(stats, start_time, len(buf))
+            if len(buf) != num_records*DATA_RECORD_LEN:
+                raise ValueError("%s is truncated: expected %d records" %
+                                 (file_name, last_rec))
+            yield _decode_buffer(buf, fields, dtype, columnar, stats)
+
+
+class DataCache(object):
+    """
+    A bounded, least recently used cache of decoded data files.
+
+    Entries are keyed by the data file name and are valid as long as the
+    file's size and mtime are unchanged.  When a file has only grown, as when
+    the vendor appends the latest records, just the new records after the
+    cached ones are read and decoded and appended to the cached array.  The
+    total size of the cached arrays is kept under max_bytes by evicting the
+    least recently used files.  Cached arrays are made read only since they
+    are shared between callers.
+
+    """
+
+    def __init__(self, max_bytes):
+        """
+        @param max_bytes: The maximum total size of the cached arrays.
+        """
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Remove everything from the cache"""
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def get(self, file_name, stats=None) -> np.ndarray:
+        """Return the decoded data in a file, from the cache if possible
+
+        @param file_name: FQ name of the data file.
+        @param stats: If given, a Stats to count hits, misses and I/O in.
+        @return: A read only structured array of dtype DATA_DTYPE.
+        """
+        stat = os.stat(file_name)
+        with self._lock:
+            entry = self._entries.get(file_name)
+            if (entry is not None and entry[0] == stat.st_size and
+                    entry[1] == stat.st_mtime_ns):
+                self._entries.move_to_end(file_name)
+                self.hits += 1
+                if stats is not None:
+                    stats.count('cache_hits')
+                return entry[2]
+
+        data = None
+        if entry is not None and entry[0] < stat.st_size:
+            data = self._read_tail(file_name, entry[2], stats)
+        if data is None:
+            data = read_data_file(file_name, stats=stats)
+            with self._lock:
+                self.misses += 1
+            if stats is not None:
+                stats.count('cache_misses')
+        else:
+            with self._lock:
+                self.refreshes += 1
+            if stats is not None:
+                stats.count('cache_refreshes')
+        data.flags.writeable = False
+
+        with self._lock:
+            old_entry = self._entries.pop(file_name, None)
+            if old_entry is not None:
+                self.num_bytes -= old_entry[2].nbytes
+            if data.nbytes <= self.max_bytes:
+                self._entries[file_name] = (stat.st_size, stat.st_mtime_ns,
+                                            data)
+                self.num_bytes += data.nbytes
+            while self.num_bytes > self.max_bytes:
+                old_entry = self._entries.popitem(last=False)[1]
+                self.num_bytes -= old_entry[2].nbytes
+        return data
+
+    # noinspection PyMethodMayBeStatic
+    def _read_tail(self, file_name, data, stats=None):
+        """Append the records added to a file since data was decoded
+
+        Returns None if the file has not simply grown, i.e. it has fewer
+        records or the last cached record was rewritten.
+        @param file_name: FQ name of the data file.
+        @param data: The previously decoded contents of the file.
+        @param stats: If given, a Stats to count the I/O and decoding in.
+        """
+        start_time = time.perf_counter() if stats is not None else 0
+        with open(file_name, 'rb') as datafile:
+            num_records = read_data_header(datafile)
+            if num_records < len(data) or 0 == len(data):
+                return None
+            datafile.seek(DATA_RECORD_LEN*len(data))
+            num_new = num_records - len(data) + 1
+            buf = datafile.read(num_new*DATA_RECORD_LEN)
+        if stats is not None:
+            _count_read(stats, start_time, len(buf))
+        if len(buf) != num_new*DATA_RECORD_LEN:
+            return None
+        tail = _decode_buffer(buf, None, 'float', False, stats)
+        if tail[:1].tobytes() != data[-1:].tobytes():
+            return None
+        return np.concatenate([data, tail[1:]])
+
+
+class MappedData(object):
+    """
+    A lazily decoded, memory mapped metastock data file.
+
+    The data file is mapped rather than read and nothing is decoded until it
+    is asked for.  Indexing with a field name, e.g. data['close'], decodes
+    that one column and caches it so later accesses are free.  Indexing with
+    an integer or a slice decodes just those records into an array of dtype
+    DATA_DTYPE.  Screening jobs that only look at a couple of columns touch
+    far less memory than with ComputracDir.get_raw_data.
+
+    """
+
+    def __init__(self, file_name, stats=None):
+        """
+        @param file_name: FQ name of the data file.
+        @param stats: If given, a Stats to count decoding in.
+        """
+        self.file_name = file_name
+        self._stats = stats
+        self._columns = {}
+        with open(file_name, 'rb') as datafile:
+            num_records = read_data_header(datafile)
+        if num_records > 0:
+            self._words = np.memmap(file_name, dtype='<u4', mode='r',
+                                    offset=DATA_RECORD_LEN,
+                                    shape=(num_records, len(DATA_DTYPE)))
+        else:
+            self._words = np.empty(shape=(0, len(DATA_DTYPE)), dtype='<u4')
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def __str__(self) -> str:
+        return "MappedData(%s, %d records)" % (self.file_name, len(self))
+
+    @property
+    def fields(self):
+        """The names of the columns available"""
+        return DATA_DTYPE.names
+
+    @property
+    def cached_fields(self):
+        """The names of the columns decoded so far"""
+        return list(self._columns.keys())
+
+    def column(self, field) -> np.ndarray:
+        """Return a single decoded column, decoding it on first access
+
+        @param field: One of the names in DATA_DTYPE, e.g. 'close'
+        """
+        if field not in self._columns:
+            if field not in DATA_DTYPE.names:
+                raise KeyError("No field %s in %s" % (field, self.file_name))
+            start_time = time.perf_counter()
+            col = fmsbin2ieee_array(self._words[:, DATA_DTYPE.names.index(
+                    field)])
+            if 'date' == field:
+                col = fmsfloat2datetime64(col)
+            else:
+                col = col.astype(DATA_DTYPE[field])
+            self._columns[field] = col
+            if self._stats is not None:
+                self._stats.add_time('decode',
+                                     time.perf_counter() - start_time)
+                self._stats.count('mapped_columns_decoded')
+        return self._columns[field]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key)
+        records = decode_data_records(self._words[key])
+        if self._stats is not None:
+            self._stats.count('records_decoded', len(records))
+        if isinstance(key, (int, np.integer)):
+            return records[0]
+        return records
+
+    def to_array(self) -> np.ndarray:
+        """Decode all the records, same as ComputracDir.get_raw_data"""
+        return self[:]
+
+
 class ComputracDir(object):
     """
     Provides easy access to historical market data in Metastock Format.
 
     Abstracts away stuff necessary to read the data.  Needs an index in
     [ex]master format.  Reads the index and buffers it.  Reads data for each
-    security on demand and returns it.  Does not buffer each security's data
-    since this could in theory exceed memory available.
+    security on demand and returns it.  By default does not buffer each
+    security's data since this could in theory exceed memory available.  If
+    cache_bytes is given decoded data is kept in a DataCache of that size
+    and arrays returned from the cache are read only.
 
     This class as specifically used to read data as distributed by Norgate
     (also called PremiumData).  This is a specific variant of the Computrac
@@ -132,13 +814,36 @@ class ComputracDir(object):
 
     """
 
-    def __init__(self, root_dir=''):
+    def __init__(self, root_dir='', index_cache=None, cache_bytes=None,
+                 instrument=False):
+        """
+        @param root_dir: If given, passed to open_base_directory
+        @param index_cache: Optional FQ name of a file in which to cache the
+            directory scan and the parsed [ex]master files between runs.
+            It is a pickle, so it must not be writable by untrusted users.
+        @param cache_bytes: If given, the maximum size of a DataCache used to
+            keep decoded data between calls to get_raw_data.
+        @param instrument: If True count and time what is done, see Stats.
+        """
         self.num_files = 0
         self.max_file_num = 0
 
+        self._refdata = np.empty(shape=0, dtype=REFDATA_DTYPE)
         self._ticker_refdata = {}
         self._name_tickers = {}
         self._master_files = []
+        self._catalog = None
+        self._tickers = None
+        self._names = None
+
+        self.index_cache = index_cache
+        self.data_cache = None
+        if cache_bytes is not None:
+            self.data_cache = DataCache(cache_bytes)
+        self._stats = Stats() if instrument else None
+        self._index = {'dirs': {}, 'masters': {}}
+        self._cached_index = {'dirs': {}, 'masters': {}}
+        self._index_dirty = False
 
         self.reset_refdata()
         if '' != root_dir:
@@ -147,13 +852,125 @@ class ComputracDir(object):
     def __str__(self) -> str:
         return self.tickers.__str__()
 
+    def enable_stats(self):
+        """Start counting and timing what is done, return the Stats"""
+        if self._stats is None:
+            self._stats = Stats()
+        return self._stats
+
+    def disable_stats(self) -> None:
+        """Stop counting and timing, discarding the Stats"""
+        self._stats = None
+
+    def stats(self):
+        """Return a snapshot of the counters and stage times
+
+        @return: A dict with 'counters' and 'seconds' dicts, see Stats, or
+            None if instrumentation is not enabled.
+        """
+        if self._stats is None:
+            return None
+        return self._stats.snapshot()
+
+    def reset_stats(self) -> None:
+        """Set all counters and stage times back to zero"""
+        if self._stats is not None:
+            self._stats.reset()
+
+    def add_stats_hook(self, hook) -> None:
+        """Call hook(kind, name, value) on every update, see Stats.add_hook
+
+        Enables instrumentation if it is not enabled.
+        """
+        self.enable_stats().add_hook(hook)
+
     def reset_refdata(self) -> None:
         """Remove all data read from emaster files"""
+        self._refdata = np.empty(shape=0, dtype=REFDATA_DTYPE)
         self._ticker_refdata = {}
         self._name_tickers = {}
         self._master_files = []
+        self._clear_indexes()
+
+    def _clear_indexes(self) -> None:
+        """Invalidate the sorted indexes built from the reference data"""
+        self._catalog = None
+        self._tickers = None
+        self._names = None
+
+    def _load_index_cache(self) -> None:
+        """Load the index cache file, ignoring it if missing or unreadable
+
+        Anything that fails to load, e.g. a cache pickled by a process with
+        a different numpy version, is ignored and the directory is scanned.
+        The file is unpickled so it must not be writable by untrusted users.
+        """
+        try:
+            with open(self.index_cache, 'rb') as cache_file:
+                cached_index = pickle.load(cache_file)
+            if INDEX_CACHE_VERSION == cached_index.get('version'):
+                self._cached_index = cached_index
+        except Exception:
+            pass
+
+    def _save_index_cache(self) -> None:
+        """Atomically replace the index cache file if anything changed"""
+        if not self._index_dirty:
+            return
+        cached_index = dict(self._index, version=INDEX_CACHE_VERSION)
+        cache_dir = os.path.dirname(os.path.abspath(self.index_cache))
+        fd, tmp_name = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as cache_file:
+                pickle.dump(cached_index, cache_file,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, self.index_cache)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        self._cached_index = cached_index
+        self._index_dirty = False
+
+    def _walk_dirs(self, root_dir):
+        """Yield (dirname, filenames) for root_dir and all its subdirs
+
+        Equivalent to os.walk, but a directory whose mtime is unchanged since
+        it was last listed is not listed again if an index cache is in use.
+        Adding, removing or renaming a file changes a directory's mtime.
+        @param root_dir: FQ name of the root directory
+        """
+        pending = [root_dir]
+        while pending:
+            dirname = pending.pop()
+            try:
+                mtime_ns = os.stat(dirname).st_mtime_ns
+            except OSError:
+                continue
+            cached = self._cached_index['dirs'].get(dirname)
+            if cached is None or cached[0] != mtime_ns:
+                subdirs, filenames = [], []
+                try:
+                    with os.scandir(dirname) as entries:
+                        for entry in entries:
+                            if not entry.is_dir():
+                                filenames.append(entry.name)
+                            elif not entry.is_symlink():
+                                subdirs.append(entry.name)
+                except OSError:
+                    continue
+                cached = (mtime_ns, subdirs, filenames)
+                self._index_dirty = True
+                if self._stats is not None:
+                    self._stats.count('dirs_scanned')
+                    self._stats.count('files_scanned', len(filenames))
+            elif self._stats is not None:
+                self._stats.count('index_cache_dir_hits')
+            if self.index_cache is not None:
+                self._index['dirs'][dirname] = cached
+            yield dirname, cached[2]
+            pending.extend(os.path.join(dirname, subdir)
+                           for subdir in reversed(cached[1]))
 
-    # noinspection PyMethodMayBeStatic
     def find_files(self, root_dir, emaster_glob):
         """
         Search the current directory and subdirs for all emaster files
@@ -165,12 +982,71 @@ class ComputracDir(object):
         if not os.path.isdir(root_dir):
             raise Exception("Directory %s does not exist" % root_dir)
 
+        start_time = time.perf_counter()
         matches = []
-        for root, dirnames, filenames in os.walk(root_dir):
+        for root, filenames in self._walk_dirs(root_dir):
             for filename in fnmatch.filter(filenames, emaster_glob):
                 matches.append(os.path.join(root, filename))
+        if self._stats is not None:
+            self._stats.add_time('scan', time.perf_counter() - start_time)
         return matches
 
+    def _read_master_file(self, master_name, parser):
+        """Parse a master file, or fetch it from the index cache if unchanged
+
+        @param master_name: FQ Name of the [ex]master format file
+        @param parser: The function parsing the file, returns (header, records)
+        """
+        stat = os.stat(master_name)
+        cached = self._cached_index['masters'].get(master_name)
+        if (cached is None or cached[0] != stat.st_size or
+                cached[1] != stat.st_mtime_ns):
+            start_time = time.perf_counter()
+            header, records = parser(master_name)
+            cached = (stat.st_size, stat.st_mtime_ns, header, records)
+            self._index_dirty = True
+            if self._stats is not None:
+                self._stats.add_time('master_parse',
+                                     time.perf_counter() - start_time)
+                self._stats.count('master_files_parsed')
+                self._stats.count('master_records', len(records))
+                self._stats.count('bytes_read', stat.st_size)
+        elif self._stats is not None:
+            self._stats.count('index_cache_master_hits')
+        if self.index_cache is not None:
+            self._index['masters'][master_name] = cached
+        return cached[2], cached[3]
+
+    def _add_records(self, records) -> None:
+        """Add reference data records parsed from a master file
+
+        @param records: An array of dtype REFDATA_DTYPE
+        """
+        refdata = np.concatenate([self._refdata, records])
+        first_row = len(self._refdata)
+        for row, (symbol, name) in enumerate(
+                zip(records['ticker'].tolist(), records['name'].tolist()),
+                start=first_row):
+            if symbol in self._ticker_refdata:
+                print("Duplicate Symbol Found: %s" % symbol)
+                old_record = refdata[self._ticker_refdata[symbol]].item()
+                record = refdata[row].item()
+                print(record)
+                print(old_record)
+                self._refdata = refdata[:row]
+                self._clear_indexes()
+                raise RuntimeError(
+                        "Duplicate ticker from dir %s, new dir %s" %
+                        (old_record[5], record[5]))
+            else:
+                self._ticker_refdata[symbol] = row
+            if name in self._name_tickers:
+                self._name_tickers[name].append(symbol)
+            else:
+                self._name_tickers[name] = [symbol]
+        self._refdata = refdata
+        self._clear_indexes()
+
     def read_emaster_file(self, emaster_name):
         """Open and read the emaster file and cache data in it
 
@@ -184,6 +1060,20 @@ class ComputracDir(object):
         if emaster_name in self.master_files:
             raise Exception("%s has already been read" % emaster_name)
 
+        header, records = self._read_master_file(emaster_name,
+                                                 self._parse_emaster_file)
+        self.num_files, self.max_file_num = header
+        self._add_records(records)
+        self._master_files.append(emaster_name)
+
+    # noinspection PyMethodMayBeStatic
+    def _parse_emaster_file(self, emaster_name):
+        """Parse an emaster file
+
+        @param emaster_name: FQ Name of the emaster format file
+        @return: (header, records), header is (num_files, max_file_num) and
+            records is an array of dtype REFDATA_DTYPE
+        """
         header_fmt = "H H 188x"
         """
          The format string for package struct to read the emaster header
@@ -225,42 +1115,41 @@ class ComputracDir(object):
         record_len = struct.calcsize(record_fmt)
         assert (header_len == record_len)
 
+        record_dtype = np.dtype({
+            'names': ['f_num', 'num_fld', 'flag', 'symbol', 'name', 'freq',
+                      'first_dt', 'last_dt', 'full_name'],
+            'formats': ['u1', 'u1', 'u1', ('u1', 21), ('u1', 28), 'u1',
+                        '<f4', '<f4', ('u1', 53)],
+            'offsets': [2, 6, 9, 11, 32, 60, 64, 72, 139],
+            'itemsize': record_len})
+        """numpy equivalent of record_fmt, strings are left as raw bytes"""
+
         with open(emaster_name, 'rb') as emaster:
-            buf = emaster.read(header_len)
-            self.num_files, self.max_file_num = struct.unpack(header_fmt, buf)
-            buf = emaster.read(record_len)
-            while len(buf) > 0:
-                assert (len(buf) == record_len)
-                (f_num, num_fld, flag, symbol, name, freq, first_dt, last_dt,
-                 full_name) = struct.unpack(record_fmt, buf)
-                filename = os.path.join(os.path.dirname(emaster_name),
-                                        'F%d.dat' % f_num)
-                flag = flag.decode()
-                symbol = strip_null(symbol).decode()
-                name = strip_null(name).decode()
-                freq = freq.decode()
-                first_dt = fmsfloat2date(first_dt)
-                last_dt = fmsfloat2date(last_dt)
-                if full_name[0] != 0:
-                    name = strip_null(full_name).decode()
-                record = (symbol, name, first_dt, last_dt, freq, filename,
-                          num_fld, flag, emaster_name)
-                if symbol in self._ticker_refdata:
-                    print("Duplicate Symbol Found: %s" % symbol)
-                    old_record = self._ticker_refdata[symbol]
-                    print(record)
-                    print(old_record)
-                    raise RuntimeError(
-                            "Duplicate ticker from dir %s, new dir %s" %
-                            (old_record[5], filename))
-                else:
-                    self._ticker_refdata[symbol] = record
-                if name in self._name_tickers:
-                    self._name_tickers[name].append(symbol)
-                else:
-                    self._name_tickers[name] = [symbol]
-                buf = emaster.read(record_len)
-            self._master_files.append(emaster_name)
+            buf = emaster.read()
+        header = struct.unpack(header_fmt, buf[:header_len])
+        assert ((len(buf) - header_len) % record_len == 0)
+        recs = np.frombuffer(buf, dtype=record_dtype, offset=header_len)
+
+        symbols = strip_null_array(recs['symbol'])
+        names = strip_null_array(recs['name'])
+        full_names = recs['full_name'][:, 0] != 0
+        if full_names.any():
+            names = [full_name if use_full else name for use_full, full_name,
+                     name in zip(full_names.tolist(),
+                                 strip_null_array(recs['full_name']), names)]
+        file_prefix = os.path.join(os.path.dirname(emaster_name), 'F')
+        records = np.empty(shape=len(recs), dtype=REFDATA_DTYPE)
+        records['ticker'] = symbols
+        records['name'] = names
+        records['start'] = fmsfloat2datetime64(recs['first_dt'])
+        records['end'] = fmsfloat2datetime64(recs['last_dt'])
+        records['freq'] = list(recs['freq'].tobytes().decode('ascii'))
+        records['file_name'] = ['%s%d.dat' % (file_prefix, f_num)
+                                for f_num in recs['f_num'].tolist()]
+        records['num_fld'] = recs['num_fld']
+        records['flag'] = list(recs['flag'].tobytes().decode('ascii'))
+        records['master_file'] = emaster_name
+        return header, records
 
     def read_xmaster_file(self, xmaster_name):
         """Open and read the xmaster file and cache data in it
@@ -274,6 +1163,22 @@ class ComputracDir(object):
         if xmaster_name in self.master_files:
             raise Exception("%s has already been read" % xmaster_name)
 
+        header, records = self._read_master_file(xmaster_name,
+                                                 self._parse_xmaster_file)
+        xmst_files, max_file_num = header
+        self.num_files += xmst_files
+        self.max_file_num = max_file_num
+        self._add_records(records)
+        self._master_files.append(xmaster_name)
+
+    # noinspection PyMethodMayBeStatic
+    def _parse_xmaster_file(self, xmaster_name):
+        """Parse an xmaster file
+
+        @param xmaster_name: FQ Name of the xmaster format file
+        @return: (header, records), header is (num_files, max_file_num) and
+            records is an array of dtype REFDATA_DTYPE
+        """
         header_fmt = "2x 2x 6x H 2x H 2x H 130x"
         """ The format string for package struct to read the xmaster header
 
@@ -315,100 +1220,153 @@ class ComputracDir(object):
         record_len = struct.calcsize(record_fmt)
         assert (header_len == record_len)
 
+        record_dtype = np.dtype({
+            'names': ['symbol', 'name', 'freq', 'f_num', 'first_dt_int',
+                      'first_dt_int2'],
+            'formats': [('u1', 15), ('u1', 32), 'u1', '<u2', '<i4', '<i4'],
+            'offsets': [1, 16, 62, 65, 104, 108],
+            'itemsize': record_len})
+        """numpy equivalent of record_fmt, strings are left as raw bytes"""
+
         with open(xmaster_name, 'rb') as xmaster:
-            buf = xmaster.read(header_len)
-            xmst_files, xmst_files2, max_file_num = struct.unpack(header_fmt,
-                                                                  buf)
-            assert xmst_files == xmst_files2
-            self.num_files += xmst_files
-            self.max_file_num = max_file_num
-            buf = xmaster.read(record_len)
-            while len(buf) > 0:
-                assert (len(buf) == record_len)
-                (symbol, name, freq, f_num, zero, first_dt_int, first_dt_int2,
-                 zero2) = struct.unpack(record_fmt, buf)
-                assert first_dt_int == first_dt_int2
-                year = int(first_dt_int/10000)
-                month = int((first_dt_int % 10000)/100)
-                day = int(first_dt_int % 100)
-                first_dt = datetime.date(year, month, day)
-                last_dt = datetime.date(3000, 12, 31)
-                filename = os.path.join(os.path.dirname(xmaster_name),
-                                        'F%d.mwd' % f_num)
-                symbol = strip_null(symbol).decode()
-                name = strip_null(name).decode()
-                freq = freq.decode()
-                num_fld = 7
-                flag = ' '
-                record = (symbol, name, first_dt, last_dt, freq, filename,
-                          num_fld, flag, xmaster_name)
-                if symbol in self._ticker_refdata:
-                    print("Duplicate Symbol Found: %s" % symbol)
-                    old_record = self._ticker_refdata[symbol]
-                    print(record)
-                    print(old_record)
-                    raise RuntimeError(
-                            "Duplicate ticker from dir %s, new dir %s" %
-                            (old_record[5], filename))
-                else:
-                    self._ticker_refdata[symbol] = record
-                if name in self._name_tickers:
-                    self._name_tickers[name].append(symbol)
-                else:
-                    self._name_tickers[name] = [symbol]
-                buf = xmaster.read(record_len)
-            self._master_files.append(xmaster_name)
+            buf = xmaster.read()
+        xmst_files, xmst_files2, max_file_num = struct.unpack(
+                header_fmt, buf[:header_len])
+        assert xmst_files == xmst_files2
+        header = (xmst_files, max_file_num)
+        assert ((len(buf) - header_len) % record_len == 0)
+        recs = np.frombuffer(buf, dtype=record_dtype, offset=header_len)
+        assert (recs['first_dt_int'] == recs['first_dt_int2']).all()
+
+        file_prefix = os.path.join(os.path.dirname(xmaster_name), 'F')
+        records = np.empty(shape=len(recs), dtype=REFDATA_DTYPE)
+        records['ticker'] = strip_null_array(recs['symbol'])
+        records['name'] = strip_null_array(recs['name'])
+        records['start'] = yyyymmdd2datetime64(recs['first_dt_int'])
+        records['end'] = np.datetime64('3000-12-31', 'D')
+        records['freq'] = list(recs['freq'].tobytes().decode('ascii'))
+        records['file_name'] = ['%s%d.mwd' % (file_prefix, f_num)
+                                for f_num in recs['f_num'].tolist()]
+        records['num_fld'] = 7
+        records['flag'] = ' '
+        records['master_file'] = xmaster_name
+        return header, records
 
     def open_base_directory(self, root_dir):
         """Find and open all [ex]master files in the root dir and subdirs
 
         By calling this function on the root data directory you should be able
         to access all data in various metastock files in the directory and all
-        subdirectories of the root data directory
+        subdirectories of the root data directory.  The directory tree is
+        walked once for both kinds of master file.  If the object was created
+        with an index_cache the directory listings and parsed master files are
+        reused from the cache for anything whose mtime and size are unchanged,
+        and the cache is updated afterwards.
         @param root_dir: The root directory which contains all Computrac data
         """
-        emaster_names = self.find_files(root_dir,
-                                        '[Ee][Mm][Aa][Ss][Tt][Ee][Rr]')
+        if not os.path.isdir(root_dir):
+            raise Exception("Directory %s does not exist" % root_dir)
+        if self.index_cache is not None:
+            self._load_index_cache()
+
+        start_time = time.perf_counter()
+        emaster_names, xmaster_names = [], []
+        for root, filenames in self._walk_dirs(root_dir):
+            for filename in fnmatch.filter(filenames,
+                                           '[Ee][Mm][Aa][Ss][Tt][Ee][Rr]'):
+                emaster_names.append(os.path.join(root, filename))
+            for filename in fnmatch.filter(filenames,
+                                           '[Xx][Mm][Aa][Ss][Tt][Ee][Rr]'):
+                xmaster_names.append(os.path.join(root, filename))
+        if self._stats is not None:
+            self._stats.add_time('scan', time.perf_counter() - start_time)
         for emaster_name in emaster_names:
             self.read_emaster_file(emaster_name)
-        xmaster_names = self.find_files(root_dir,
-                                        '[Xx][Mm][Aa][Ss][Tt][Ee][Rr]')
         for xmaster_name in xmaster_names:
             self.read_xmaster_file(xmaster_name)
 
+        if self.index_cache is not None:
+            self._save_index_cache()
+
     @property
     def catalog(self):
         """
         A catalog of symbols available with start and end dates
 
+        The catalog is built once after master files are read and the same
+        read only array is returned until more master files are read.
         :return: The catalog
         """
-        items = np.empty(shape=len(self.tickers),
-                         dtype=np.dtype([('ticker', 'S32'),
-                                         ('name', 'S256'),
-                                         ('freq', 'S1'),
-                                         ('start', 'M8[D]'),
-                                         ('end', 'M8[D]')]))
-        for idx, tkr in enumerate(self.tickers):
-            cur_rec = self.get_reference_data(tkr)
-            items[idx]['ticker'] = cur_rec[0]
-            items[idx]['name'] = cur_rec[1]
-            # noinspection PyUnresolvedReferences
-            items[idx]['start'] = np.datetime64(cur_rec[2], 'D')
-            # noinspection PyUnresolvedReferences
-            items[idx]['end'] = np.datetime64(cur_rec[3], 'D')
-            items[idx]['freq'] = cur_rec[4]
-        return items
+        if self._catalog is None:
+            start_time = time.perf_counter()
+            order = np.argsort(self._refdata['ticker'].astype(str),
+                               kind='stable')
+            refdata = self._refdata[order]
+            items = np.empty(shape=len(refdata), dtype=CATALOG_DTYPE)
+            items['ticker'] = refdata['ticker']
+            items['name'] = refdata['name']
+            items['start'] = refdata['start']
+            items['end'] = refdata['end']
+            items['freq'] = refdata['freq']
+            items.flags.writeable = False
+            self._catalog = items
+            if self._stats is not None:
+                self._stats.add_time('catalog',
+                                     time.perf_counter() - start_time)
+        return self._catalog
 
     @property
     def tickers(self):
         """Return all tickers for which we have data"""
-        return np.sort(list(self._ticker_refdata.keys()))
+        if self._tickers is None:
+            self._tickers = np.sort(list(self._ticker_refdata.keys()))
+            self._tickers.flags.writeable = False
+        return self._tickers
 
     @property
     def names(self):
         """Return all asset names for which we have data"""
-        return np.sort(list(self._name_tickers.keys()))
+        if self._names is None:
+            self._names = np.sort(list(self._name_tickers.keys()))
+            self._names.flags.writeable = False
+        return self._names
+
+    # noinspection PyMethodMayBeStatic
+    def _match_sorted(self, sorted_ids, pattern) -> list:
+        """Return the elements of a sorted array matching a wildcard pattern
+
+        The literal prefix of the pattern narrows the search to a range of
+        the sorted array with a binary search, the rest of the pattern is
+        matched with fnmatch (case sensitive) only within that range.
+        @param sorted_ids: A sorted array of str
+        @param pattern: An fnmatch style pattern, e.g. 'BHP*' or 'X??.AX'
+        """
+        prefix = re.split(r'[*?\[]', pattern, maxsplit=1)[0]
+        lo = np.searchsorted(sorted_ids, prefix, 'left')
+        hi = np.searchsorted(sorted_ids, prefix + chr(0x10ffff), 'left')
+        if prefix == pattern[:-1] and pattern.endswith('*'):
+            return sorted_ids[lo:hi].tolist()
+        match = re.compile(fnmatch.translate(pattern)).match
+        return [asset_id for asset_id in sorted_ids[lo:hi].tolist()
+                if match(asset_id)]
+
+    def match_tickers(self, pattern) -> list:
+        """Return the sorted tickers matching a prefix or wildcard pattern
+
+        @param pattern: An fnmatch style pattern, e.g. 'BHP*' or 'X??.AX'
+        """
+        return self._match_sorted(self.tickers, pattern)
+
+    def match_names(self, pattern) -> list:
+        """Return the sorted asset names matching a wildcard pattern
+
+        @param pattern: An fnmatch style pattern, e.g. 'BHP*'
+        """
+        return self._match_sorted(self.names, pattern)
+
+    def __contains__(self, asset_id) -> bool:
+        return (asset_id in self._ticker_refdata or
+                asset_id in self._name_tickers)
 
     @property
     def master_files(self):
@@ -419,21 +1377,9 @@ class ComputracDir(object):
         """Get the reference data for an asset given it's name or ticker
         @param asset_id: May be a ticker or asset name
         """
-        if asset_id in self._ticker_refdata:
-            return self._ticker_refdata[asset_id]
-        elif asset_id in self._name_tickers:
-            tickers_list = self._name_tickers[asset_id]
-            if len(tickers_list) == 1:
-                return self._ticker_refdata[tickers_list[0]]
-            else:
-                multi_ticker_str = " - ".join(tickers_list)
-                raise LookupError(
-                        "Multiple Tickers correspond to Name %s, Tickers: %s",
-                        (asset_id, multi_ticker_str))
-        else:
-            raise LookupError(
-                    "Asset ID: %s does not correspond to any ticker or name." %
-                    asset_id)
+        ticker = lookup_ticker(asset_id, self._ticker_refdata,
+                               self._name_tickers)
+        return self._refdata[self._ticker_refdata[ticker]].item()
 
     def get_tickers(self, name):
         """Return the tickers corresponding to a Name (may be > 1)."""
@@ -442,58 +1388,248 @@ class ComputracDir(object):
         else:
             raise LookupError("No asset with name %s found" % name)
 
-    def get_raw_data(self, asset_id):
+    def get_raw_data(self, asset_id, start=None, end=None, fields=None,
+                     dtype='float', columnar=False):
         """Return the underlying data given the name or ticker of an asset
+
+        If a date range is given only the records in the range are read from
+        disk, see read_data_file.  Otherwise the data cache is used if there
+        is one.  By default all seven fields are returned as one structured
+        array of dtype DATA_DTYPE.  Asking for fewer fields, float32 or a
+        columnar layout decodes and allocates only what is asked for.
         @param asset_id: may be a ticker or an asset name
+        @param start: If given, the first date (inclusive) to return.
+        @param end: If given, the last date (inclusive) to return.
+        @param fields: If given, return only these fields, e.g.
+            ('date', 'close').
+        @param dtype: The float type of the price and volume fields, float64
+            by default or float32 as stored on disk.
+        @param columnar: If True return a dict of field name to contiguous
+            array instead of a structured array.
         """
-        header_fmt = "H H 24x"
-        """Format string for the header of a 7 field data file
-        totalRecords: ushort = Not used by metastock itself
-        lastRecord: ushort = The last record in the file
-        24 blanks
-        """
-        record_fmt = "f f f f f f f"
-        """Format string for a 7 field metastock data record
-        All floats, no padding, but the floats are in MS Basic format not
-        IEEE format so you can't use struct unpack with the record_fmt as a
-        format string.  Instead use the function fmsbin2ieee with the relevant
-        4 raw bytes as an argument
-        date, open, high, low, close, volume, openInterest
-        """
-
-        header_len = struct.calcsize(header_fmt)
-        record_len = struct.calcsize(record_fmt)
-        assert(header_len == record_len)
         (symbol, name, first_dt, last_dt, freq, file_name, num_fld, flag,
          master_file) = self.get_reference_data(asset_id)
-        with open(file_name, 'rb') as datafile:
-            buf = datafile.read(header_len)
-            (junk, num_records) = struct.unpack(header_fmt, buf)
-            ohlc_data = np.empty(shape=(num_records-1),
-                                 dtype=[('date',          'M8[D]'),
-                                        ('open',          'float'),
-                                        ('high',          'float'),
-                                        ('low',           'float'),
-                                        ('close',         'float'),
-                                        ('volume',        'float'),
-                                        ('open_interest', 'float')])
-            rec_num = 0
-            buf = datafile.read(record_len)
-            while len(buf) > 0:
-                assert(len(buf) == record_len)
-                # noinspection PyUnresolvedReferences,PyTypeChecker
-                ohlc_data[rec_num] = (
-                    np.datetime64(fmsfloat2date(fmsbin2ieee(buf[0:4])), 'D'),
-                    fmsbin2ieee(buf[4:8]),
-                    fmsbin2ieee(buf[8:12]),
-                    fmsbin2ieee(buf[12:16]),
-                    fmsbin2ieee(buf[16:20]),
-                    fmsbin2ieee(buf[20:24]),
-                    fmsbin2ieee(buf[24:28]))
-                rec_num += 1
-                buf = datafile.read(record_len)
-
-        return ohlc_data
+        if self.data_cache is not None and start is None and end is None:
+            data = self.data_cache.get(file_name, self._stats)
+            if fields is None and 'float' == dtype and not columnar:
+                return data
+            return project_data(data, fields, dtype, columnar)
+        return read_data_file(file_name, start=start, end=end, fields=fields,
+                              dtype=dtype, columnar=columnar,
+                              stats=self._stats)
+
+    def iter_chunks(self, asset_id, chunk_records=65536, start=None,
+                    end=None, fields=None, dtype='float', columnar=False):
+        """Iterate over an asset's data in chunks of at most chunk_records
+
+        See iter_data_file.
+        @param asset_id: may be a ticker or an asset name
+        @param chunk_records: The maximum number of records in each chunk.
+        @param start: If given, the first date (inclusive) to return.
+        @param end: If given, the last date (inclusive) to return.
+        @param fields: If given, return only these fields.
+        @param dtype: The float type of the price and volume fields.
+        @param columnar: If True yield dicts of field name to array.
+        """
+        file_name = self.get_reference_data(asset_id)[5]
+        return iter_data_file(file_name, chunk_records=chunk_records,
+                              start=start, end=end, fields=fields,
+                              dtype=dtype, columnar=columnar,
+                              stats=self._stats)
+
+    def iter_many(self, asset_ids, workers=None, processes=False, start=None,
+                  end=None, fields=None, dtype='float', columnar=False):
+        """Load the data for many assets concurrently
+
+        Yields (asset_id, data) tuples in the order the loads finish.  A load
+        that fails does not stop the others; the exception raised is yielded
+        in place of the data, so check with isinstance(data, Exception).
+        Nothing is kept after it is yielded, so a caller which consumes each
+        asset and drops it does not hold the whole universe at once.
+        @param asset_ids: An iterable of tickers or asset names
+        @param workers: The maximum number of concurrent loads, defaults to
+            the concurrent.futures default for the executor used.
+        @param processes: If True decode in a pool of processes instead of
+            threads.  Threads suit I/O bound loads (e.g. network storage),
+            processes suit decode bound loads.  Loads done in other
+            processes bypass the data cache and are not counted in stats.
+        @param start: If given, the first date (inclusive) to return.
+        @param end: If given, the last date (inclusive) to return.
+        @param fields: If given, return only these fields.
+        @param dtype: The float type of the price and volume fields.
+        @param columnar: If True return dicts of field name to array.
+        """
+        data_dtype(fields, dtype)
+        asset_ids = list(dict.fromkeys(asset_ids))
+        if processes:
+            executor = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(workers)
+        try:
+            futures = {}
+            for asset_id in asset_ids:
+                if processes:
+                    try:
+                        file_name = self.get_reference_data(asset_id)[5]
+                    except LookupError as exc:
+                        yield asset_id, exc
+                        continue
+                    future = executor.submit(read_data_file, file_name,
+                                             start, end, fields, dtype,
+                                             columnar)
+                else:
+                    future = executor.submit(self.get_raw_data, asset_id,
+                                             start, end, fields, dtype,
+                                             columnar)
+                futures[future] = asset_id
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    data = future.result()
+                except Exception as exc:
+                    data = exc
+                # Popped so the result is freed once the caller drops it
+                yield futures.pop(future), data
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def get_many(self, asset_ids, workers=None, processes=False, start=None,
+                 end=None, errors=None, fields=None, dtype='float',
+                 columnar=False):
+        """Load the data for many assets concurrently and return a dict
+
+        See iter_many.  Assets which fail to load are left out of the dict
+        returned.  If errors is a dict the exception for each failed asset is
+        stored in it, otherwise a warning is issued for each failure.
+        @param asset_ids: An iterable of tickers or asset names
+        @param workers: The maximum number of concurrent loads
+        @param processes: If True decode in a pool of processes
+        @param start: If given, the first date (inclusive) to return.
+        @param end: If given, the last date (inclusive) to return.
+        @param errors: An optional dict to collect failures in.
+        @param fields: If given, return only these fields.
+        @param dtype: The float type of the price and volume fields.
+        @param columnar: If True return dicts of field name to array.
+        @return: A dict of asset_id to data array.
+        """
+        results = {}
+        for asset_id, data in self.iter_many(asset_ids, workers=workers,
+                                             processes=processes,
+                                             start=start, end=end,
+                                             fields=fields, dtype=dtype,
+                                             columnar=columnar):
+            if not isinstance(data, Exception):
+                results[asset_id] = data
+            elif errors is not None:
+                errors[asset_id] = data
+            else:
+                warnings.warn("Failed to load %s: %s" % (asset_id, data))
+        return results
+
+    def get_panel(self, asset_ids, fields=('close',), start=None, end=None,
+                  workers=None, errors=None, dtype='float'):
+        """Load many assets and align them on a common date axis
+
+        The date axis is the sorted union of the dates of all the assets.
+        Each field is returned as a C contiguous 2-D float array of shape
+        (number of dates, number of assets), with NaN wherever an asset has no
+        record for a date.  The alignment is done with a single searchsorted
+        and scatter per field over all the assets at once.  Assets which fail
+        to load are reported as in get_many and left as all NaN columns.
+        @param asset_ids: A list of tickers or asset names, the column order
+        @param fields: The data fields to return, e.g. ('close', 'volume')
+        @param start: If given, the first date (inclusive) to return.
+        @param end: If given, the last date (inclusive) to return.
+        @param workers: The maximum number of concurrent loads
+        @param errors: An optional dict to collect failures in.
+        @param dtype: The float type of the panels.
+        @return: (dates, panels) where dates is an M8[D] array and panels is a
+            dict of field name to 2-D array.
+        """
+        for field in fields:
+            if field not in DATA_DTYPE.names[1:]:
+                raise ValueError("Cannot build a panel of field %s" % field)
+        asset_ids = list(asset_ids)
+        loaded = self.get_many(asset_ids, workers=workers, start=start,
+                               end=end, errors=errors,
+                               fields=('date',) + tuple(fields), dtype=dtype,
+                               columnar=True)
+        columns = [col for col, asset_id in enumerate(asset_ids)
+                   if asset_id in loaded]
+        data = [loaded[asset_ids[col]] for col in columns]
+        all_dates = np.concatenate([d['date'] for d in data] +
+                                   [np.empty(0, dtype='M8[D]')])
+        dates = np.unique(all_dates)
+        rows = np.searchsorted(dates, all_dates)
+        cols = np.repeat(columns, [len(d['date']) for d in data])
+        panels = {}
+        for field in fields:
+            panel = np.full(shape=(len(dates), len(asset_ids)),
+                            fill_value=np.nan, dtype=dtype)
+            if len(data) > 0:
+                panel[rows, cols] = np.concatenate([d[field] for d in data])
+            panels[field] = panel
+        return dates, panels
+
+    def snapshot(self, dt, fields=('close', 'volume'), tickers=None,
+                 workers=None, errors=None, dtype='float'):
+        """Return the record on or before a date for every ticker
+
+        Tickers whose catalog start and end dates show they have no data on
+        dt are skipped without opening their files.  For the others the
+        record is located by binary search of the on disk date column and
+        only that record is read (see read_data_asof), on a thread pool.
+        Tickers which fail to load are reported as in get_many.
+        @param dt: The as-of date
+        @param fields: The data fields to return
+        @param tickers: If given, only these tickers, otherwise all of them
+        @param workers: The maximum number of concurrent reads
+        @param errors: An optional dict to collect failures in.
+        @param dtype: The float type of the price and volume fields.
+        @return: A structured array sorted by ticker with fields ticker, date
+            (the date of the record found) and the fields asked for.
+        """
+        fields = tuple(field for field in fields if 'date' != field)
+        out_dtype = np.dtype([('ticker', 'S32')] +
+                             data_dtype(('date',) + fields, dtype).descr)
+        dt = np.datetime64(dt, 'D')
+        catalog = self.catalog
+        in_range = (catalog['start'] <= dt) & (catalog['end'] >= dt)
+        if tickers is not None:
+            in_range &= np.isin(catalog['ticker'],
+                                np.asarray(tickers, dtype='S32'))
+        candidates = catalog['ticker'][in_range]
+
+        def read_asof(ticker):
+            file_name = self.get_reference_data(ticker.decode())[5]
+            return read_data_asof(file_name, dt, ('date',) + fields, dtype,
+                                  self._stats)
+
+        records = []
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(read_asof, ticker)
+                       for ticker in candidates]
+            for ticker, future in zip(candidates, futures):
+                try:
+                    data = future.result()
+                except Exception as exc:
+                    if errors is not None:
+                        errors[ticker.decode()] = exc
+                    else:
+                        warnings.warn("Failed to load %s: %s" %
+                                      (ticker.decode(), exc))
+                    continue
+                if len(data) > 0:
+                    records.append((ticker,) + data[0].item())
+        return np.array(records, dtype=out_dtype)
+
+    def get_mapped_data(self, asset_id):
+        """Return a lazily decoded memory map of an asset's data file
+
+        Unlike get_raw_data nothing is read or decoded up front.  See
+        MappedData.
+        @param asset_id: may be a ticker or an asset name
+        """
+        return MappedData(self.get_reference_data(asset_id)[5], self._stats)
 
     def __getitem__(self, asset_id):
         return self.get_raw_data(asset_id)
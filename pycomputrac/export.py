@@ -0,0 +1,315 @@
+import os
+import sys
+import time
+import zipfile
+import concurrent.futures
+import h5py
+import numpy as np
+
+from .computrac import (DATA_RECORD_LEN, data_dtype, find_record_range,
+                        iter_data_file, read_data_file)
+from .store import catalog2stored, ticker2key
+
+EXPORT_FORMATS = ('csv', 'npy', 'npz', 'hdf5')
+"""csv and npy write a file per ticker, npz and hdf5 a single file"""
+
+
+def format_csv_rows(chunk) -> str:
+    """Format a columnar chunk of data as CSV rows
+
+    Each column is converted to strings in one vectorized call, floats with
+    the shortest repr which round trips.
+    @param chunk: A dict of field name to array, see iter_data_file
+    """
+    columns = [column.astype(str).tolist() for column in chunk.values()]
+    if 0 == len(columns) or 0 == len(columns[0]):
+        return ''
+    return '\n'.join(map(','.join, zip(*columns))) + '\n'
+
+
+def count_records(file_name, start=None, end=None) -> int:
+    """Return the number of records of a data file in a date range"""
+    with open(file_name, 'rb') as datafile:
+        first_rec, last_rec = find_record_range(datafile, start, end)
+    return last_rec - first_rec
+
+
+def write_npy_stream(out_file, chunks, num_records, dtype) -> int:
+    """Write chunks of a structured array to an open file in .npy format
+
+    The header is written first so the chunks are written as they come.
+    @param out_file: A file opened for binary writing
+    @param chunks: An iterable of structured arrays of dtype dtype
+    @param num_records: The total number of records in the chunks
+    @param dtype: The dtype of the chunks
+    @return: The number of records written
+    """
+    np.lib.format.write_array_header_1_0(out_file, {
+            'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            'fortran_order': False,
+            'shape': (num_records,)})
+    written = 0
+    for chunk in chunks:
+        out_file.write(chunk.tobytes())
+        written += len(chunk)
+    if written != num_records:
+        raise RuntimeError("Expected %d records, read %d: the data file "
+                           "changed during the export" %
+                           (num_records, written))
+    return written
+
+
+def export_data_file(file_name, out_name, fmt='csv', start=None, end=None,
+                     fields=None, dtype='float32', chunk_records=65536):
+    """Export a data file to a CSV or .npy file, chunk by chunk
+
+    @param file_name: FQ name of the data file.
+    @param out_name: The file to write
+    @param fmt: 'csv' or 'npy'
+    @param start: If given, the first date (inclusive) to export.
+    @param end: If given, the last date (inclusive) to export.
+    @param fields: If given, export only these fields.
+    @param dtype: The float type of the price and volume fields.
+    @param chunk_records: The maximum number of records decoded at once
+    @return: The number of records written
+    """
+    out_dtype = data_dtype(fields, dtype)
+    if 'npy' == fmt:
+        with open(out_name, 'wb') as out_file:
+            return write_npy_stream(
+                    out_file, iter_data_file(file_name, chunk_records, start,
+                                             end, fields, dtype),
+                    count_records(file_name, start, end), out_dtype)
+    elif 'csv' != fmt:
+        raise ValueError("Cannot export %s a file at a time" % fmt)
+    records = 0
+    with open(out_name, 'w', buffering=2**20) as out_file:
+        out_file.write(','.join(out_dtype.names) + '\n')
+        for chunk in iter_data_file(file_name, chunk_records, start, end,
+                                    fields, dtype, columnar=True):
+            out_file.write(format_csv_rows(chunk))
+            records += len(chunk[out_dtype.names[0]])
+    return records
+
+
+class ExportProgress(object):
+    """
+    Reports the progress and throughput of an export on a text stream.
+
+    A status line is written at most every interval seconds and a summary
+    when the export finishes.  Throughput is counted in the records and
+    bytes of the data files read.
+
+    """
+
+    def __init__(self, num_tickers, out=sys.stderr, interval=1.0):
+        """
+        @param num_tickers: The number of tickers to export
+        @param out: The stream to report on, None for no output
+        @param interval: The minimum seconds between status lines
+        """
+        self.num_tickers = num_tickers
+        self.out = out
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.records = 0
+        self.start_time = time.perf_counter()
+        self._last_report = self.start_time
+
+    @property
+    def num_bytes(self) -> int:
+        """The bytes of data records read so far"""
+        return self.records*DATA_RECORD_LEN
+
+    def status(self) -> str:
+        """Return a line describing the progress so far"""
+        seconds = max(time.perf_counter() - self.start_time, 1e-9)
+        return ('%d/%d tickers, %d failed, %d records in %.1fs '
+                '(%.0f records/sec, %.1f MB/sec)' % (
+                        self.done, self.num_tickers, self.failed,
+                        self.records, seconds, self.records/seconds,
+                        self.num_bytes/seconds/2**20))
+
+    def update(self, records, failed=False) -> None:
+        """Count a ticker as done, reporting if interval has passed"""
+        self.done += 1
+        self.failed += failed
+        self.records += records
+        now = time.perf_counter()
+        if self.out is not None and now - self._last_report >= self.interval:
+            self._last_report = now
+            print(self.status(), file=self.out, flush=True)
+
+    def finish(self) -> None:
+        """Report the totals"""
+        if self.out is not None:
+            print(self.status(), file=self.out, flush=True)
+
+
+class Exporter(object):
+    """
+    Exports data from a ComputracDir to CSV, NumPy or HDF5 files.
+
+    Tickers are exported concurrently on a thread or process pool.  For the
+    per ticker formats each worker streams its ticker's data file chunk by
+    chunk into out_dir/<ticker>.csv or .npy, see export_data_file.  For the
+    single file formats the workers decode the tickers and the calling
+    thread writes each into out_dir/export.npz as an archive member or into
+    out_dir/export.h5 as a dataset in the layout of a ComputracStore, which
+    can read the file if every field is exported.  At most two tickers per
+    worker are in flight, so the memory used does not grow with the size of
+    the archive.  Tickers are quoted with ticker2key to make file, member
+    and dataset names.
+
+    """
+
+    def __init__(self, computrac_dir, out_dir, fmt='csv', start=None,
+                 end=None, fields=None, dtype='float32', chunk_records=65536):
+        """
+        @param computrac_dir: The ComputracDir to export from
+        @param out_dir: The directory to write to, created if necessary
+        @param fmt: One of EXPORT_FORMATS
+        @param start: If given, the first date (inclusive) to export.
+        @param end: If given, the last date (inclusive) to export.
+        @param fields: If given, export only these fields.
+        @param dtype: The float type of the price and volume fields.  The
+            data is float32 on disk so float32 loses nothing.
+        @param chunk_records: The maximum number of records decoded at once
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError("Unknown export format %s, expected one of %s" %
+                             (fmt, ', '.join(EXPORT_FORMATS)))
+        self.computrac_dir = computrac_dir
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.start = start
+        self.end = end
+        self.fields = fields
+        self.dtype = dtype
+        self.chunk_records = chunk_records
+        self.out_dtype = data_dtype(fields, dtype)
+
+    def export(self, tickers=None, workers=None, processes=False,
+               errors=None, progress=None):
+        """Export tickers, all of them by default
+
+        Tickers which fail to export are reported as in
+        ComputracDir.get_many and do not stop the others.
+        @param tickers: If given, the tickers to export
+        @param workers: The maximum number of concurrent exports
+        @param processes: If True decode and format in a pool of processes
+            instead of threads, which suits CSV since formatting floats is
+            CPU bound.
+        @param errors: An optional dict to collect failures in.
+        @param progress: If given, an ExportProgress to report to
+        @return: A dict of ticker to the number of records exported.
+        """
+        if tickers is None:
+            tickers = self.computrac_dir.tickers
+        tickers = [str(ticker) for ticker in tickers]
+        os.makedirs(self.out_dir, exist_ok=True)
+        single_file = self.fmt in ('npz', 'hdf5')
+        writer = None
+        if 'npz' == self.fmt:
+            writer = zipfile.ZipFile(os.path.join(self.out_dir, 'export.npz'),
+                                     'w', allowZip64=True)
+        elif 'hdf5' == self.fmt:
+            writer = h5py.File(os.path.join(self.out_dir, 'export.h5'), 'w')
+
+        exported = {}
+        if workers is None:
+            workers = min(32, (os.cpu_count() or 1) + 4)
+        if processes:
+            executor = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(workers)
+
+        def failed(ticker, exc):
+            if errors is not None:
+                errors[ticker] = exc
+            else:
+                print("Failed to export %s: %s" % (ticker, exc),
+                      file=sys.stderr)
+            if progress is not None:
+                progress.update(0, failed=True)
+
+        try:
+            pending = {}
+            remaining = iter(tickers)
+            while True:
+                for ticker in remaining:
+                    try:
+                        file_name = self.computrac_dir.get_reference_data(
+                                ticker)[5]
+                    except LookupError as exc:
+                        failed(ticker, exc)
+                        continue
+                    if single_file:
+                        future = executor.submit(
+                                read_data_file, file_name, self.start,
+                                self.end, self.fields, self.dtype)
+                    else:
+                        future = executor.submit(
+                                export_data_file, file_name,
+                                os.path.join(self.out_dir, '%s.%s' % (
+                                        ticker2key(ticker), self.fmt)),
+                                self.fmt, self.start, self.end, self.fields,
+                                self.dtype, self.chunk_records)
+                    pending[future] = ticker
+                    if len(pending) >= 2*workers:
+                        break
+                if not pending:
+                    break
+                done, _ = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    ticker = pending.pop(future)
+                    try:
+                        result = future.result()
+                        if single_file:
+                            self._write_member(writer, ticker, result)
+                            result = len(result)
+                    except Exception as exc:
+                        failed(ticker, exc)
+                        continue
+                    exported[ticker] = result
+                    if progress is not None:
+                        progress.update(result)
+            if 'hdf5' == self.fmt:
+                self._write_catalog(writer, exported)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            if writer is not None:
+                writer.close()
+        if progress is not None:
+            progress.finish()
+        return exported
+
+    def _write_member(self, writer, ticker, data) -> None:
+        """Write a ticker's data into the single output file"""
+        key = ticker2key(ticker)
+        if 'npz' == self.fmt:
+            with writer.open(key + '.npy', 'w', force_zip64=True) as member:
+                write_npy_stream(member, [data], len(data), data.dtype)
+            return
+        # Stored as by ComputracStore, dates as days since 1970-01-01
+        stored = np.empty(shape=len(data), dtype=[
+                (field, '<i4' if 'date' == field else self.out_dtype[field])
+                for field in self.out_dtype.names])
+        for field in self.out_dtype.names:
+            stored[field] = data[field]
+        if 'date' in self.out_dtype.names:
+            stored['date'] = data['date'].astype('i8')
+        writer.require_group('data').create_dataset(
+                key, data=stored, chunks=(len(stored) > 0) or None,
+                compression='gzip' if len(stored) else None,
+                shuffle=len(stored) > 0)
+
+    def _write_catalog(self, writer, exported) -> None:
+        """Write the catalog of the tickers exported to the HDF5 file"""
+        catalog = self.computrac_dir.catalog
+        catalog = catalog[np.isin(catalog['ticker'],
+                                  np.array(list(exported), dtype='S32'))]
+        writer.create_dataset('catalog', data=catalog2stored(catalog))
@@ -0,0 +1,273 @@
+import os
+import threading
+import warnings
+import collections
+import numpy as np
+
+BAR_AGGREGATES = {'date':          'last',
+                  'open':          'first',
+                  'high':          np.maximum,
+                  'low':           np.minimum,
+                  'close':         'last',
+                  'volume':        np.add,
+                  'open_interest': 'last'}
+"""How each field is aggregated into a bar
+
+A bar takes the first or last record's value of a field or reduces the field
+over the bar's records with a ufunc, so bars are dated with their last
+record and volumes are summed.
+"""
+
+CALENDAR_FREQS = ('D', 'W', 'M', 'Q', 'Y')
+"""Calendar bar frequencies, weeks start on Monday"""
+
+
+def period_keys(dates, freq) -> np.ndarray:
+    """Return an integer key for each date which changes with each period
+
+    @param dates: An array of dates
+    @param freq: One of CALENDAR_FREQS
+    """
+    days = np.asarray(dates, dtype='M8[D]').astype(np.int64)
+    if 'D' == freq:
+        return days
+    elif 'W' == freq:
+        # 1970-01-01 was a Thursday, shift so that weeks start on Monday
+        return (days + 3)//7
+    months = np.asarray(dates, dtype='M8[M]').astype(np.int64)
+    if 'M' == freq:
+        return months
+    elif 'Q' == freq:
+        return months//3
+    elif 'Y' == freq:
+        return months//12
+    raise ValueError("Unknown bar frequency %s, expected one of %s or a "
+                     "number of records" % (freq, ', '.join(CALENDAR_FREQS)))
+
+
+def resample_many(data_list, freq) -> list:
+    """Aggregate many assets' data into bars with one reduction per field
+
+    The data of all the assets is concatenated and each field reduced over
+    every bar of every asset with a single ufunc.reduceat, see
+    BAR_AGGREGATES.  Only the fields present are aggregated, so projected
+    data from get_raw_data(fields=...) can be resampled.
+    @param data_list: A list of structured arrays like those returned by
+        get_raw_data, or dicts of field name to array, all with the same
+        fields including date.
+    @param freq: One of CALENDAR_FREQS, or an int N for bars of N records
+        (N trading days for daily data).
+    @return: A list of the resampled data in the same layout as data_list.
+    """
+    data_list = list(data_list)
+    if 0 == len(data_list):
+        return []
+    first = data_list[0]
+    columnar = not isinstance(first, np.ndarray)
+    fields = list(first.keys() if columnar else first.dtype.names)
+    for field in fields:
+        if field not in BAR_AGGREGATES:
+            raise ValueError("Cannot resample field %s" % field)
+    if 'date' not in fields:
+        raise ValueError("Resampling needs the date field")
+
+    lengths = np.array([len(data['date']) for data in data_list])
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    total = offsets[-1]
+    columns = {field: np.concatenate([data[field] for data in data_list])
+               for field in fields}
+
+    if isinstance(freq, (int, np.integer)):
+        if freq < 1:
+            raise ValueError("Bars must be at least 1 record long")
+        keys = (np.arange(total) - np.repeat(offsets[:-1], lengths))//freq
+    else:
+        keys = period_keys(columns['date'], freq)
+    new_bar = np.ones(shape=total, dtype=bool)
+    new_bar[1:] = keys[1:] != keys[:-1]
+    new_bar[offsets[:-1][lengths > 0]] = True
+    starts = np.flatnonzero(new_bar)
+    lasts = np.append(starts[1:], total) - 1
+
+    bars = {}
+    for field in fields:
+        column = columns[field]
+        if 0 == len(starts):
+            bars[field] = column[:0]
+        elif 'first' == BAR_AGGREGATES[field]:
+            bars[field] = column[starts]
+        elif 'last' == BAR_AGGREGATES[field]:
+            bars[field] = column[lasts]
+        else:
+            bars[field] = BAR_AGGREGATES[field].reduceat(column, starts)
+
+    splits = np.searchsorted(starts, offsets[1:-1])
+    if columnar:
+        split_bars = {field: np.split(bars[field], splits)
+                      for field in fields}
+        return [{field: split_bars[field][num] for field in fields}
+                for num in range(len(data_list))]
+    out = np.empty(shape=len(starts), dtype=first.dtype)
+    for field in fields:
+        out[field] = bars[field]
+    return np.split(out, splits)
+
+
+def resample(data, freq):
+    """Aggregate an asset's data into bars
+
+    See resample_many.
+    @param data: A structured array like those returned by get_raw_data, or
+        a dict of field name to array.
+    @param freq: One of CALENDAR_FREQS, or an int N for bars of N records
+    @return: The resampled data in the same layout as data.
+    """
+    return resample_many([data], freq)[0]
+
+
+class Resampler(object):
+    """
+    Serves a ComputracDir's data resampled into weekly, monthly etc bars.
+
+    Assets are loaded with ComputracDir.get_many and resampled together, see
+    resample_many.  If max_bytes is given resampled results are kept in a
+    least recently used cache keyed by the data file's name, size and mtime
+    and the resampling parameters, so they are recomputed only when the
+    vendor updates the file.  Cached arrays are made read only since they
+    are shared between callers.
+
+    """
+
+    def __init__(self, computrac_dir, max_bytes=None):
+        """
+        @param computrac_dir: The ComputracDir to load data from
+        @param max_bytes: If given, the maximum total size of the cached
+            resampled arrays.
+        """
+        self.computrac_dir = computrac_dir
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        """Remove everything from the cache"""
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def _cache_key(self, asset_id, params):
+        """Return the cache key of an asset, or None if not caching"""
+        if self.max_bytes is None:
+            return None
+        file_name = self.computrac_dir.get_reference_data(asset_id)[5]
+        stat = os.stat(file_name)
+        return (file_name, stat.st_size, stat.st_mtime_ns) + params
+
+    def _cache_put(self, key, data):
+        """Cache a copy of data and return the copy
+
+        resample_many returns views of one array shared by the whole batch,
+        so the data is copied to make the cache hold, and count, only the
+        bytes of each entry.
+        """
+        if isinstance(data, np.ndarray):
+            data = data.copy()
+            data.flags.writeable = False
+            num_bytes = data.nbytes
+        else:
+            data = {field: column.copy() for field, column in data.items()}
+            for column in data.values():
+                column.flags.writeable = False
+            num_bytes = sum(column.nbytes for column in data.values())
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.num_bytes -= old_entry[1]
+            if num_bytes <= self.max_bytes:
+                self._entries[key] = (data, num_bytes)
+                self.num_bytes += num_bytes
+            while self.num_bytes > self.max_bytes:
+                self.num_bytes -= self._entries.popitem(last=False)[1][1]
+        return data
+
+    def get_many(self, asset_ids, freq='W', workers=None, start=None,
+                 end=None, errors=None, fields=None, dtype='float',
+                 columnar=False):
+        """Load and resample the data for many assets
+
+        Assets which fail to load are left out of the dict returned and
+        reported as in ComputracDir.get_many.
+        @param asset_ids: An iterable of tickers or asset names
+        @param freq: One of CALENDAR_FREQS, or an int N for bars of N records
+        @param workers: The maximum number of concurrent loads
+        @param start: If given, the first date (inclusive) to aggregate.
+        @param end: If given, the last date (inclusive) to aggregate.
+        @param errors: An optional dict to collect failures in.
+        @param fields: If given, return only these fields, date is always
+            returned.
+        @param dtype: The float type of the price and volume fields.
+        @param columnar: If True return dicts of field name to array.
+        @return: A dict of asset_id to resampled data.
+        """
+        if fields is not None and 'date' not in fields:
+            fields = ('date',) + tuple(fields)
+        params = (freq, start, end, None if fields is None else tuple(fields),
+                  np.dtype(dtype).str, columnar)
+        results, keys = {}, {}
+        for asset_id in dict.fromkeys(asset_ids):
+            try:
+                keys[asset_id] = self._cache_key(asset_id, params)
+            except Exception as exc:
+                if errors is not None:
+                    errors[asset_id] = exc
+                else:
+                    warnings.warn("Failed to load %s: %s" % (asset_id, exc))
+                continue
+            with self._lock:
+                entry = self._entries.get(keys[asset_id])
+                if entry is not None:
+                    self._entries.move_to_end(keys[asset_id])
+                    self.hits += 1
+                    results[asset_id] = entry[0]
+                elif keys[asset_id] is not None:
+                    self.misses += 1
+
+        to_load = [asset_id for asset_id in keys if asset_id not in results]
+        loaded = self.computrac_dir.get_many(
+                to_load, workers=workers, start=start, end=end,
+                errors=errors, fields=fields, dtype=dtype, columnar=columnar)
+        loaded_ids = [asset_id for asset_id in to_load if asset_id in loaded]
+        resampled = resample_many([loaded[asset_id]
+                                   for asset_id in loaded_ids], freq)
+        for asset_id, data in zip(loaded_ids, resampled):
+            if keys[asset_id] is not None:
+                data = self._cache_put(keys[asset_id], data)
+            results[asset_id] = data
+        return results
+
+    def get_resampled(self, asset_id, freq='W', start=None, end=None,
+                      fields=None, dtype='float', columnar=False):
+        """Return an asset's data resampled into bars
+
+        See get_many.
+        @param asset_id: may be a ticker or an asset name
+        @param freq: One of CALENDAR_FREQS, or an int N for bars of N records
+        @param start: If given, the first date (inclusive) to aggregate.
+        @param end: If given, the last date (inclusive) to aggregate.
+        @param fields: If given, return only these fields.
+        @param dtype: The float type of the price and volume fields.
+        @param columnar: If True return a dict of field name to array.
+        """
+        errors = {}
+        results = self.get_many([asset_id], freq, workers=1, start=start,
+                                end=end, errors=errors, fields=fields,
+                                dtype=dtype, columnar=columnar)
+        if asset_id in errors:
+            raise errors[asset_id]
+        return results[asset_id]
+
+    def __getitem__(self, asset_id):
+        return self.get_resampled(asset_id)
@@ -0,0 +1,297 @@
+import time
+import struct
+import datetime
+import concurrent.futures
+import numpy as np
+
+from .computrac import (DATA_DTYPE, DATA_HEADER_FMT, DATA_RECORD_LEN,
+                        fmsbin2ieee_array)
+
+ISSUE_DTYPE = np.dtype([('ticker',       'S32'),
+                        ('file_name',    'O'),
+                        ('check',        'U20'),
+                        ('severity',     'U7'),
+                        ('count',        '<i8'),
+                        ('first_record', '<i8'),
+                        ('detail',       'O')])
+"""The dtype of the issues found by a scan
+
+count is the number of records failing the check and first_record the
+index of the first of them, or -1 for checks of the whole file.
+"""
+
+FILE_DTYPE = np.dtype([('ticker',      'S32'),
+                       ('file_name',   'O'),
+                       ('num_bytes',   '<i8'),
+                       ('num_records', '<i8'),
+                       ('errors',      '<i4'),
+                       ('warnings',    '<i4')])
+"""The dtype of the per file summary of a scan"""
+
+CHECKS = {'missing':            'error',
+          'unreadable':         'error',
+          'partial_record':     'error',
+          'truncated':          'error',
+          'trailing_records':   'warning',
+          'num_fields':         'warning',
+          'non_finite':         'error',
+          'zero_exponent':      'warning',
+          'invalid_dates':      'error',
+          'dates_out_of_range': 'error',
+          'unsorted_dates':     'error',
+          'duplicate_dates':    'warning',
+          'negative_values':    'warning',
+          'high_below_low':     'warning',
+          'open_outside_range': 'warning',
+          'close_outside_range': 'warning',
+          'master_first_date':  'warning',
+          'master_last_date':   'warning'}
+"""Every check a scan makes and the severity of failing it"""
+
+XMASTER_END = np.datetime64('3000-12-31', 'D')
+"""The end date given to xmaster entries, which record no last date"""
+
+
+def _issue(issues, check, mask=None, detail=''):
+    """Record an issue if any element of mask is set, or unconditionally"""
+    if mask is None:
+        issues.append((check, CHECKS[check], 1, -1, detail))
+        return
+    bad = np.flatnonzero(mask)
+    if len(bad) > 0:
+        issues.append((check, CHECKS[check], len(bad), bad[0], detail))
+
+
+def _valid_dates(ms_dates):
+    """Return (valid mask, dates) for metastock date floats
+
+    Invalid dates, including non integral, non finite or huge ones, are
+    NaT.  Huge dates are masked before the cast to int64 would overflow.
+    """
+    valid = np.isfinite(ms_dates) & (ms_dates == np.round(ms_dates))
+    valid &= np.abs(ms_dates) < 1e8
+    yyyymmdd = np.where(valid, ms_dates, 0).astype(np.int64) + 19000000
+    yyyy = yyyymmdd // 10000
+    mm = (yyyymmdd - (yyyy*10000)) // 100
+    dd = yyyymmdd % 100
+    valid &= (yyyy >= 1) & (yyyy <= 9999) & (mm >= 1) & (mm <= 12)
+    valid &= (dd >= 1) & (dd <= 31)
+    months = np.where(valid, (yyyy - 1970)*12 + mm - 1, 0).astype('M8[M]')
+    dates = months.astype('M8[D]') + np.where(valid, dd - 1, 0)
+    valid &= dates < (months + 1).astype('M8[D]')
+    dates[~valid] = np.datetime64('NaT')
+    return valid, dates
+
+
+def scan_data_file(file_name, first_dt=None, last_dt=None, num_fld=7,
+                   min_date='1900-01-01', max_date=None):
+    """Check a metastock data file for corruption
+
+    The file is read once and every check is vectorized over the whole
+    file, see CHECKS.  Nothing is raised for a bad file, the problems found
+    are returned.
+    @param file_name: FQ name of the data file.
+    @param first_dt: If given, the first date according to the master file
+    @param last_dt: If given, the last date according to the master file
+    @param num_fld: The number of fields according to the master file
+    @param min_date: Dates before this are out of range
+    @param max_date: Dates after this are out of range, default today
+    @return: (num_bytes, num_records, issues) where issues is a list of
+        (check, severity, count, first_record, detail) tuples.
+    """
+    issues = []
+    try:
+        raw = np.fromfile(file_name, dtype=np.uint8)
+    except FileNotFoundError as exc:
+        _issue(issues, 'missing', detail=str(exc))
+        return 0, 0, issues
+    except OSError as exc:
+        _issue(issues, 'unreadable', detail=str(exc))
+        return 0, 0, issues
+
+    num_fields = len(DATA_DTYPE)
+    if num_fld != num_fields:
+        _issue(issues, 'num_fields', detail="master file gives %d fields, "
+               "%d are read" % (num_fld, num_fields))
+    if len(raw) < DATA_RECORD_LEN:
+        _issue(issues, 'partial_record',
+               detail="%d bytes is too short for the header" % len(raw))
+        return len(raw), 0, issues
+    if len(raw) % DATA_RECORD_LEN:
+        _issue(issues, 'partial_record',
+               detail="%d bytes after the last whole record" %
+                      (len(raw) % DATA_RECORD_LEN))
+
+    # The header's lastRecord counts the header itself
+    (junk, last_record) = struct.unpack('<' + DATA_HEADER_FMT,
+                                        raw[:DATA_RECORD_LEN].tobytes())
+    num_records = max(last_record - 1, 0)
+    on_disk = len(raw)//DATA_RECORD_LEN - 1
+    if num_records > on_disk:
+        _issue(issues, 'truncated', detail="header gives %d records, the file "
+               "holds %d" % (num_records, on_disk))
+        num_records = on_disk
+    elif num_records < on_disk:
+        _issue(issues, 'trailing_records', detail="%d records after the "
+               "header's last record" % (on_disk - num_records))
+
+    words = raw[DATA_RECORD_LEN:DATA_RECORD_LEN*(num_records + 1)].view(
+            '<u4').reshape(num_records, num_fields)
+    _issue(issues, 'zero_exponent',
+           (((words >> 24) == 0) & ((words & 0xffffff) != 0)).any(axis=1),
+           'non zero MBF value with a zero exponent reads as 0')
+    values = fmsbin2ieee_array(words)
+    _issue(issues, 'non_finite', ~np.isfinite(values).all(axis=1))
+
+    valid, dates = _valid_dates(values[:, 0].astype(np.float64))
+    _issue(issues, 'invalid_dates', ~valid)
+    if max_date is None:
+        max_date = datetime.date.today()
+    _issue(issues, 'dates_out_of_range',
+           valid & ((dates < np.datetime64(min_date, 'D')) |
+                    (dates > np.datetime64(max_date, 'D'))),
+           'outside %s - %s' % (min_date, max_date))
+    valid_dates = dates[valid]
+    steps = valid_dates[1:] - valid_dates[:-1]
+    valid_rows = np.flatnonzero(valid)[1:]
+    for check, step_mask in (('unsorted_dates', steps < np.timedelta64(0)),
+                             ('duplicate_dates', steps == np.timedelta64(0))):
+        mask = np.zeros(shape=num_records, dtype=bool)
+        mask[valid_rows[step_mask]] = True
+        _issue(issues, check, mask)
+
+    with np.errstate(invalid='ignore'):
+        (open_, high, low, close, volume, open_interest) = values[:, 1:].T
+        _issue(issues, 'negative_values', (values[:, 1:] < 0).any(axis=1))
+        _issue(issues, 'high_below_low', high < low)
+        _issue(issues, 'open_outside_range',
+               (open_ != 0) & ((open_ < low) | (open_ > high)))
+        _issue(issues, 'close_outside_range', (close < low) | (close > high))
+
+    if len(valid_dates) > 0:
+        if (first_dt is not None and
+                np.datetime64(first_dt, 'D') != valid_dates[0]):
+            _issue(issues, 'master_first_date', detail="master file gives "
+                   "%s, the data starts %s" % (first_dt, valid_dates[0]))
+        if (last_dt is not None and
+                np.datetime64(last_dt, 'D') != XMASTER_END and
+                np.datetime64(last_dt, 'D') != valid_dates[-1]):
+            _issue(issues, 'master_last_date', detail="master file gives "
+                   "%s, the data ends %s" % (last_dt, valid_dates[-1]))
+    return len(raw), num_records, issues
+
+
+class ScanReport(object):
+    """
+    The results of scanning the data files of a ComputracDir.
+
+    files summarises each file scanned and issues lists every problem found,
+    both as structured arrays sorted by ticker, see FILE_DTYPE and
+    ISSUE_DTYPE.  ok is False if any check of severity 'error' failed.
+
+    """
+
+    def __init__(self, files, issues, seconds):
+        """
+        @param files: An array of dtype FILE_DTYPE
+        @param issues: An array of dtype ISSUE_DTYPE
+        @param seconds: The wall time the scan took
+        """
+        self.files = files
+        self.issues = issues
+        self.seconds = seconds
+
+    def __str__(self) -> str:
+        lines = ['Scanned %d files, %d records, %.1f MB in %.2fs: %d errors, '
+                 '%d warnings' % (len(self.files),
+                                  self.files['num_records'].sum(),
+                                  self.num_bytes/2**20, self.seconds,
+                                  self.files['errors'].sum(),
+                                  self.files['warnings'].sum())]
+        for issue in self.issues:
+            where = ''
+            if issue['first_record'] >= 0:
+                where = ' %d records from record %d' % (issue['count'],
+                                                        issue['first_record'])
+            lines.append('%s %s %s: %s%s %s' % (
+                    issue['severity'], issue['ticker'].decode(),
+                    issue['file_name'], issue['check'], where,
+                    issue['detail']))
+        return '\n'.join(lines)
+
+    @property
+    def ok(self) -> bool:
+        """True if no errors were found"""
+        return not (self.issues['severity'] == 'error').any()
+
+    @property
+    def num_bytes(self) -> int:
+        """The total size of the files scanned"""
+        return int(self.files['num_bytes'].sum())
+
+    def counts(self) -> dict:
+        """Return the number of files failing each check"""
+        checks, counts = np.unique(self.issues['check'], return_counts=True)
+        return dict(zip(checks.tolist(), counts.tolist()))
+
+    def to_dict(self) -> dict:
+        """Return the report as a JSON serializable dict"""
+        return {'ok': self.ok,
+                'seconds': self.seconds,
+                'num_files': len(self.files),
+                'num_records': int(self.files['num_records'].sum()),
+                'num_bytes': self.num_bytes,
+                'counts': self.counts(),
+                'issues': [{'ticker': issue['ticker'].decode(),
+                            'file_name': issue['file_name'],
+                            'check': str(issue['check']),
+                            'severity': str(issue['severity']),
+                            'count': int(issue['count']),
+                            'first_record': int(issue['first_record']),
+                            'detail': issue['detail']}
+                           for issue in self.issues]}
+
+
+def scan_directory(computrac_dir, tickers=None, workers=None,
+                   processes=False, min_date='1900-01-01', max_date=None):
+    """Check every data file of a ComputracDir for corruption in parallel
+
+    See scan_data_file.  The data files are compared with their entries in
+    the master files.
+    @param computrac_dir: The ComputracDir to scan
+    @param tickers: If given, scan only these tickers' files
+    @param workers: The maximum number of concurrent scans
+    @param processes: If True scan in a pool of processes instead of threads
+    @param min_date: Dates before this are out of range
+    @param max_date: Dates after this are out of range, default today
+    @return: A ScanReport
+    """
+    start_time = time.perf_counter()
+    if tickers is None:
+        tickers = computrac_dir.tickers
+    tickers = sorted(str(ticker) for ticker in tickers)
+    if processes:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(workers)
+    with executor:
+        futures = []
+        for ticker in tickers:
+            (symbol, name, first_dt, last_dt, freq, file_name, num_fld, flag,
+             master_file) = computrac_dir.get_reference_data(ticker)
+            futures.append(executor.submit(scan_data_file, file_name,
+                                           first_dt, last_dt, num_fld,
+                                           min_date, max_date))
+        files, issues = [], []
+        for ticker, future in zip(tickers, futures):
+            file_name = computrac_dir.get_reference_data(ticker)[5]
+            num_bytes, num_records, file_issues = future.result()
+            severities = [issue[1] for issue in file_issues]
+            files.append((ticker, file_name, num_bytes, num_records,
+                          severities.count('error'),
+                          severities.count('warning')))
+            issues.extend((ticker, file_name) + issue
+                          for issue in file_issues)
+    return ScanReport(np.array(files, dtype=FILE_DTYPE),
+                      np.array(issues, dtype=ISSUE_DTYPE),
+                      time.perf_counter() - start_time)
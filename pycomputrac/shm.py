@@ -0,0 +1,298 @@
+import sys
+import threading
+import pickle
+import struct
+import weakref
+import warnings
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+from .computrac import (CATALOG_DTYPE, data_dtype, lookup_ticker,
+                        read_data_header)
+
+MANIFEST_VERSION = 1
+
+MANIFEST_HEADER_FMT = "<Q"
+"""The manifest segment header, the length of the pickled manifest after it"""
+
+_attach_lock = threading.Lock()
+
+
+def _attach_segment(name) -> shared_memory.SharedMemory:
+    """Attach to an existing segment without taking ownership of it
+
+    Before Python 3.13 attaching registers the segment with the
+    resource_tracker, which unlinks it when this process exits even though
+    the owner is still using it.  Unregistering afterwards is no good for
+    forked workers, which share the owner's tracker and would remove the
+    owner's registration, so registration is skipped while attaching.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+
+def _read_manifest(segment) -> dict:
+    """Read the manifest published in a manifest segment"""
+    header_len = struct.calcsize(MANIFEST_HEADER_FMT)
+    (manifest_len,) = struct.unpack(MANIFEST_HEADER_FMT,
+                                    segment.buf[:header_len])
+    manifest = pickle.loads(segment.buf[header_len:header_len + manifest_len])
+    if MANIFEST_VERSION != manifest.get('version'):
+        raise RuntimeError("Shared data %s has manifest version %s, expected "
+                           "%s" % (segment.name, manifest.get('version'),
+                                   MANIFEST_VERSION))
+    return manifest
+
+
+def _release_segments(segments, unlink) -> None:
+    """Close, and if the owner unlink, shared memory segments"""
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            # A view of the segment is still alive, the mapping goes when
+            # the process exits
+            pass
+        if unlink:
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedData(object):
+    """
+    Decoded data published in shared memory for a pool of worker processes.
+
+    One process decodes the data with SharedData.create, which copies every
+    asset into a single shared memory segment and publishes a small manifest
+    segment holding the catalog and where each asset's records are.  Worker
+    processes attach with SharedData(name) and get_raw_data returns read
+    only views of the shared segment, so the decoded universe is held in RAM
+    once however many workers use it.
+
+    The creating process owns the segments and unlinks them when it calls
+    close, when the object is garbage collected or at interpreter exit.
+    Attached workers never unlink them.  Views returned by get_raw_data must
+    not be used after close.
+
+    """
+
+    def __init__(self, name):
+        """Attach to data published by SharedData.create
+
+        @param name: The name of the manifest segment, SharedData.name
+        """
+        segments = [_attach_segment(name)]
+        try:
+            manifest = _read_manifest(segments[0])
+            segments.append(_attach_segment(manifest['segment']))
+        except BaseException:
+            _release_segments(segments, False)
+            raise
+        self._setup(name, manifest, segments, owner=False)
+
+    def _setup(self, name, manifest, segments, owner) -> None:
+        self.name = name
+        self.manifest = manifest
+        self._owner = owner
+        self._finalizer = weakref.finalize(self, _release_segments, segments,
+                                           owner)
+        self._catalog = manifest['catalog']
+        self._catalog.flags.writeable = False
+        self._data = np.ndarray(shape=manifest['num_records'],
+                                dtype=np.dtype(manifest['dtype']),
+                                buffer=segments[1].buf)
+        self._data.flags.writeable = False
+        self._ticker_rows = {ticker.decode(): row for row, ticker in
+                             enumerate(self._catalog['ticker'])}
+        self._name_tickers = {}
+        for ticker, asset_name in zip(self._catalog['ticker'],
+                                      self._catalog['name']):
+            self._name_tickers.setdefault(asset_name.decode(), []).append(
+                    ticker.decode())
+
+    @classmethod
+    def create(cls, computrac_dir, asset_ids=None, workers=None, errors=None,
+               fields=None, dtype='float'):
+        """Decode assets into shared memory and publish them
+
+        The segment is sized from the data file headers and assets are
+        loaded with ComputracDir.iter_many and copied in as each load
+        completes, so the decoded universe is not held twice.  Assets which
+        fail to load are left out and reported as ComputracDir.get_many
+        does.
+        @param computrac_dir: The ComputracDir to load data from
+        @param asset_ids: The tickers or names to publish, all by default
+        @param workers: The maximum number of concurrent loads
+        @param errors: An optional dict to collect failures in.
+        @param fields: If given, publish only these fields.
+        @param dtype: The float type of the price and volume fields.
+        @return: The owning SharedData, pass its name to the workers.
+        """
+        out_dtype = data_dtype(fields, dtype)
+        if asset_ids is None:
+            asset_ids = computrac_dir.tickers
+
+        def failed(asset_id, exc):
+            if errors is not None:
+                errors[asset_id] = exc
+            else:
+                warnings.warn("Failed to load %s: %s" % (asset_id, exc))
+
+        asset_tickers, counts = {}, {}
+        for asset_id in dict.fromkeys(str(asset_id) for asset_id in asset_ids):
+            try:
+                (ticker, name, first_dt, last_dt, freq, file_name, num_fld,
+                 flag, master_file) = computrac_dir.get_reference_data(
+                        asset_id)
+                with open(file_name, 'rb') as datafile:
+                    counts[ticker] = read_data_header(datafile)
+            except Exception as exc:
+                failed(asset_id, exc)
+                continue
+            asset_tickers[ticker] = asset_id
+
+        catalog = computrac_dir.catalog
+        catalog = catalog[np.isin(catalog['ticker'],
+                                  np.array(list(counts), dtype='S32'))]
+        manifest_catalog = np.empty(
+                shape=len(catalog),
+                dtype=np.dtype(CATALOG_DTYPE.descr + [('offset', '<i8'),
+                                                      ('count', '<i8')]))
+        for field in CATALOG_DTYPE.names:
+            manifest_catalog[field] = catalog[field]
+        manifest_catalog['count'] = [counts[ticker.decode()]
+                                     for ticker in catalog['ticker']]
+        manifest_catalog['offset'] = (np.cumsum(manifest_catalog['count']) -
+                                      manifest_catalog['count'])
+        num_records = int(manifest_catalog['count'].sum())
+        rows = {ticker.decode(): row
+                for row, ticker in enumerate(manifest_catalog['ticker'])}
+
+        segments = []
+        try:
+            segments.append(shared_memory.SharedMemory(
+                    create=True, size=max(num_records*out_dtype.itemsize, 1)))
+            shared = np.ndarray(shape=num_records, dtype=out_dtype,
+                                buffer=segments[0].buf)
+            loaded = np.zeros(shape=len(manifest_catalog), dtype=bool)
+            data = None
+            for ticker, data in computrac_dir.iter_many(
+                    rows, workers=workers, fields=fields, dtype=dtype):
+                row = rows[ticker]
+                if (not isinstance(data, Exception) and
+                        len(data) > manifest_catalog['count'][row]):
+                    data = RuntimeError("%s grew while it was loaded" %
+                                        ticker)
+                if isinstance(data, Exception):
+                    failed(asset_tickers[ticker], data)
+                    continue
+                offset = manifest_catalog['offset'][row]
+                shared[offset:offset + len(data)] = data
+                manifest_catalog['count'][row] = len(data)
+                loaded[row] = True
+            del shared, data
+            manifest_catalog = manifest_catalog[loaded]
+
+            manifest = {'version': MANIFEST_VERSION,
+                        'segment': segments[0].name,
+                        'dtype': out_dtype.descr,
+                        'num_records': num_records,
+                        'catalog': manifest_catalog}
+            buf = pickle.dumps(manifest, protocol=pickle.HIGHEST_PROTOCOL)
+            buf = struct.pack(MANIFEST_HEADER_FMT, len(buf)) + buf
+            segments.insert(0, shared_memory.SharedMemory(create=True,
+                                                          size=len(buf)))
+            segments[0].buf[:len(buf)] = buf
+        except BaseException:
+            _release_segments(segments, True)
+            raise
+
+        shared_data = cls.__new__(cls)
+        shared_data._setup(segments[0].name, manifest, segments, owner=True)
+        return shared_data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __str__(self) -> str:
+        return self.tickers.__str__()
+
+    @property
+    def owner(self) -> bool:
+        """True in the process which created, and will unlink, the data"""
+        return self._owner
+
+    def close(self) -> None:
+        """Release the shared memory, unlinking it if this is the owner"""
+        self._data = None
+        self._finalizer()
+
+    @property
+    def catalog(self):
+        """
+        A catalog of the symbols published with start and end dates
+
+        :return: The catalog as ComputracDir.catalog, plus the offset and
+            count of each symbol's records in the shared segment
+        """
+        return self._catalog
+
+    @property
+    def tickers(self):
+        """Return all tickers for which we have data"""
+        return np.array([t.decode() for t in self._catalog['ticker']])
+
+    @property
+    def names(self):
+        """Return all asset names for which we have data"""
+        return np.sort(list(self._name_tickers.keys()))
+
+    def __contains__(self, asset_id) -> bool:
+        return asset_id in self._ticker_rows or asset_id in self._name_tickers
+
+    def get_tickers(self, name):
+        """Return the tickers corresponding to a Name (may be > 1)."""
+        if name in self._name_tickers:
+            return self._name_tickers.get(name)
+        else:
+            raise LookupError("No asset with name %s found" % name)
+
+    def get_raw_data(self, asset_id, start=None, end=None):
+        """Return a read only view of an asset's data in shared memory
+
+        @param asset_id: may be a ticker or an asset name
+        @param start: If given, the first date (inclusive) to return.
+        @param end: If given, the last date (inclusive) to return.
+        @return: A structured array of the dtype the data was published with
+        """
+        if self._data is None:
+            raise RuntimeError("Shared data %s is closed" % self.name)
+        row = self._ticker_rows[lookup_ticker(asset_id, self._ticker_rows,
+                                              self._name_tickers)]
+        offset = self._catalog['offset'][row]
+        data = self._data[offset:offset + self._catalog['count'][row]]
+        if start is not None or end is not None:
+            first_rec, last_rec = 0, len(data)
+            if end is not None:
+                last_rec = np.searchsorted(data['date'],
+                                           np.datetime64(end, 'D'), 'right')
+            if start is not None:
+                first_rec = np.searchsorted(data['date'][:last_rec],
+                                            np.datetime64(start, 'D'), 'left')
+            data = data[first_rec:max(first_rec, last_rec)]
+        return data
+
+    def __getitem__(self, asset_id):
+        return self.get_raw_data(asset_id)
@@ -0,0 +1,235 @@
+import os
+import urllib.parse
+import warnings
+import h5py
+import numpy as np
+
+from .computrac import CATALOG_DTYPE, DATA_DTYPE, lookup_ticker
+
+STORE_DTYPE = np.dtype([('date',          '<i4'),
+                        ('open',          '<f4'),
+                        ('high',          '<f4'),
+                        ('low',           '<f4'),
+                        ('close',         '<f4'),
+                        ('volume',        '<f4'),
+                        ('open_interest', '<f4')])
+"""The dtype each asset's data is stored with in the HDF5 file
+
+Metastock stores 4 byte floats so float32 loses nothing.  Dates are stored
+as days since 1970-01-01 since HDF5 has no datetime64 type.
+"""
+
+STORE_CATALOG_DTYPE = np.dtype([('ticker', 'S32'),
+                                ('name',   'S256'),
+                                ('freq',   'S1'),
+                                ('start',  '<i8'),
+                                ('end',    '<i8')])
+"""The dtype the catalog is stored with, dates as days since 1970-01-01"""
+
+
+def ticker2key(ticker) -> str:
+    """Return the name of the HDF5 dataset holding a ticker's data
+
+    Tickers may contain '/' which is the HDF5 path separator, so they are
+    percent encoded.
+    @param ticker: the ticker
+    """
+    return urllib.parse.quote(ticker, safe='')
+
+
+def catalog2stored(catalog) -> np.ndarray:
+    """Convert a catalog of dtype CATALOG_DTYPE to STORE_CATALOG_DTYPE"""
+    stored = np.empty(shape=len(catalog), dtype=STORE_CATALOG_DTYPE)
+    for field in ('ticker', 'name', 'freq'):
+        stored[field] = catalog[field]
+    stored['start'] = catalog['start'].astype('i8')
+    stored['end'] = catalog['end'].astype('i8')
+    return stored
+
+
+def stored2catalog(stored) -> np.ndarray:
+    """Convert a catalog of dtype STORE_CATALOG_DTYPE to CATALOG_DTYPE"""
+    catalog = np.empty(shape=len(stored), dtype=CATALOG_DTYPE)
+    for field in ('ticker', 'name', 'freq'):
+        catalog[field] = stored[field]
+    catalog['start'] = stored['start'].astype('M8[D]')
+    catalog['end'] = stored['end'].astype('M8[D]')
+    return catalog
+
+
+class ComputracStore(object):
+    """
+    Metastock data consolidated into a single HDF5 file.
+
+    The store holds one chunked, compressed dataset per ticker under /data
+    plus the catalog as a table.  Each dataset records the size and
+    modification time of the data file it was imported from so sync only
+    re-imports tickers whose data file has changed.  The store has the same
+    catalog and get_raw_data interface as ComputracDir, so jobs can open one
+    file instead of walking thousands of small files on network storage.
+
+    """
+
+    def __init__(self, file_name, mode='r', compression='gzip'):
+        """
+        @param file_name: FQ name of the HDF5 file
+        @param mode: h5py file mode, 'r' to read, 'a' to create or sync
+        @param compression: h5py compression filter for the data sets
+        """
+        self.file_name = file_name
+        self.compression = compression
+        self._h5 = h5py.File(file_name, mode)
+        self._load_catalog()
+
+    def __str__(self) -> str:
+        return self.tickers.__str__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """Close the underlying HDF5 file"""
+        self._h5.close()
+
+    def _load_catalog(self) -> None:
+        if 'catalog' in self._h5:
+            stored = self._h5['catalog'][:]
+        else:
+            stored = np.empty(shape=0, dtype=STORE_CATALOG_DTYPE)
+        self._catalog = stored2catalog(stored)
+        # The tickers with a dataset, unquoted from the dataset names
+        self._stored_tickers = set()
+        if 'data' in self._h5:
+            self._stored_tickers = set(map(urllib.parse.unquote,
+                                           self._h5['data'].keys()))
+        self._name_tickers = {}
+        for ticker, name in zip(self._catalog['ticker'],
+                                self._catalog['name']):
+            self._name_tickers.setdefault(name.decode(), []).append(
+                    ticker.decode())
+
+    def sync(self, computrac_dir, workers=None, errors=None):
+        """Import the data in a ComputracDir, skipping unchanged tickers
+
+        A ticker is re-imported if its data file's size or mtime differ from
+        when it was last imported.  Tickers no longer in computrac_dir are
+        removed from the store.  Files are loaded concurrently with
+        ComputracDir.iter_many.  Tickers which fail to load are reported as in
+        ComputracDir.get_many and left as they were.
+        @param computrac_dir: The ComputracDir to import from
+        @param workers: The maximum number of concurrent loads
+        @param errors: An optional dict to collect failures in.
+        @return: The list of tickers (re-)imported.
+        """
+        data_group = self._h5.require_group('data')
+        tickers = [str(ticker) for ticker in computrac_dir.tickers]
+        file_stats = {}
+        for ticker in tickers:
+            file_name = computrac_dir.get_reference_data(ticker)[5]
+            key = ticker2key(ticker)
+            try:
+                stat = os.stat(file_name)
+            except OSError:
+                stat = None
+            if (stat is not None and key in data_group and
+                    data_group[key].attrs['file_name'] == file_name and
+                    data_group[key].attrs['size'] == stat.st_size and
+                    data_group[key].attrs['mtime_ns'] == stat.st_mtime_ns):
+                continue
+            file_stats[ticker] = (file_name, stat)
+
+        for key in set(data_group.keys()) - set(map(ticker2key, tickers)):
+            del data_group[key]
+
+        imported = []
+        for ticker, data in computrac_dir.iter_many(file_stats.keys(),
+                                                    workers=workers):
+            if isinstance(data, Exception):
+                if errors is not None:
+                    errors[ticker] = data
+                else:
+                    warnings.warn("Failed to import %s: %s" % (ticker, data))
+                continue
+            stored = np.empty(shape=len(data), dtype=STORE_DTYPE)
+            stored['date'] = data['date'].astype('i8')
+            for field in DATA_DTYPE.names[1:]:
+                stored[field] = data[field]
+            key = ticker2key(ticker)
+            if key in data_group:
+                del data_group[key]
+            dataset = data_group.create_dataset(
+                    key, data=stored, chunks=(len(stored) > 0) or None,
+                    compression=self.compression if len(stored) else None,
+                    shuffle=len(stored) > 0)
+            file_name, stat = file_stats[ticker]
+            dataset.attrs['file_name'] = file_name
+            dataset.attrs['size'] = stat.st_size
+            dataset.attrs['mtime_ns'] = stat.st_mtime_ns
+            imported.append(ticker)
+
+        stored = catalog2stored(computrac_dir.catalog)
+        if 'catalog' in self._h5:
+            del self._h5['catalog']
+        self._h5.create_dataset('catalog', data=stored)
+        self._h5.flush()
+        self._load_catalog()
+        return imported
+
+    @property
+    def catalog(self):
+        """
+        A catalog of symbols available with start and end dates
+
+        :return: The catalog, same as ComputracDir.catalog
+        """
+        return self._catalog.copy()
+
+    @property
+    def tickers(self):
+        """Return all tickers for which we have data"""
+        return np.array([t.decode() for t in self._catalog['ticker']])
+
+    @property
+    def names(self):
+        """Return all asset names for which we have data"""
+        return np.sort(list(self._name_tickers.keys()))
+
+    def get_tickers(self, name):
+        """Return the tickers corresponding to a Name (may be > 1)."""
+        if name in self._name_tickers:
+            return self._name_tickers.get(name)
+        else:
+            raise LookupError("No asset with name %s found" % name)
+
+    def get_raw_data(self, asset_id, start=None, end=None):
+        """Return the underlying data given the name or ticker of an asset
+
+        @param asset_id: may be a ticker or an asset name
+        @param start: If given, the first date (inclusive) to return.
+        @param end: If given, the last date (inclusive) to return.
+        @return: A structured array of dtype DATA_DTYPE.
+        """
+        dataset = self._h5['data'][ticker2key(lookup_ticker(
+                asset_id, self._stored_tickers, self._name_tickers))]
+        first_rec, last_rec = 0, len(dataset)
+        if start is not None or end is not None:
+            dates = dataset.fields('date')[:]
+            if end is not None:
+                last_rec = np.searchsorted(
+                        dates, np.datetime64(end, 'D').astype('i8'), 'right')
+            if start is not None:
+                first_rec = np.searchsorted(
+                        dates[:last_rec],
+                        np.datetime64(start, 'D').astype('i8'), 'left')
+        stored = dataset[first_rec:max(first_rec, last_rec)]
+        ohlc_data = np.empty(shape=len(stored), dtype=DATA_DTYPE)
+        ohlc_data['date'] = stored['date'].astype('M8[D]')
+        for field in DATA_DTYPE.names[1:]:
+            ohlc_data[field] = stored[field]
+        return ohlc_data
+
+    def __getitem__(self, asset_id):
+        return self.get_raw_data(asset_id)
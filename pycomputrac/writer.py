@@ -0,0 +1,338 @@
+import os
+import re
+import struct
+import numpy as np
+
+from .computrac import (ComputracDir, DATA_DTYPE, DATA_HEADER_FMT,
+                        DATA_RECORD_LEN, read_data_header, read_data_asof,
+                        fmsbin2ieee_array)
+
+EMASTER_HEADER_FMT = "<H H 188x"
+"""Format string for the emaster header, see ComputracDir.read_emaster_file"""
+
+EMASTER_RECORD_FMT = "<2x B 3x B 2x c x 21s 28s c 3x f 4x f 63x 53s"
+"""Format string for an emaster record, see ComputracDir.read_emaster_file"""
+
+XMASTER_HEADER_FMT = "<2s 2s 6x H 2x H 2x H 130x"
+"""Format string for the xmaster header, see ComputracDir.read_xmaster_file
+
+The first two fields are the pad bytes and the 'XM' signature.
+"""
+
+XMASTER_RECORD_FMT = "<x 15s 32s 14x c 2x H 13x i 20x i i i 34x"
+"""Format string for an xmaster record, see ComputracDir.read_xmaster_file
+
+The dates are firstDate, the two dates the reader takes the first date
+from, and lastDate2.
+"""
+
+EMASTER_MAX_FILES = 255
+"""emaster files can only index F1 - F255, the rest go in xmaster"""
+
+MAX_DATA_RECORDS = 2**16 - 2
+"""The lastRecord header field is a ushort and counts the header too"""
+
+
+def ieee2fmsbin_array(values) -> np.ndarray:
+    """Convert an array of IEEE format floats to MS Basic format floats
+
+    The inverse of fmsbin2ieee_array: each float is converted to float32 and
+    its bits rearranged into an MS Basic format float held in a uint32, so
+    fmsbin2ieee_array(ieee2fmsbin_array(x)) == np.float32(x) exactly.  Zero
+    (of either sign) becomes the all zero MS Basic float.  MS Basic format
+    has no infinity or NaN and a smaller exponent range, so those and
+    floats of magnitude 2**127 or more raise ValueError.
+    @param values: An array of floats.
+    @return: An array of uint32 with the same shape as values.
+    """
+    with np.errstate(over='ignore'):
+        ieee = np.asarray(values, dtype='<f4').view('<u4')
+
+    # The 8 bit exponent of the IEEE float, MBF is bias 128 and IEEE is bias
+    # 127 and MBF places the decimal point before the assumed bit.
+    ms_exp = ((ieee >> 23) & 0xff).astype(np.uint32) + 2
+    if (ms_exp > 0xff).any():
+        raise ValueError("Value cannot be represented as an MS Basic float")
+
+    # Sign moves from bit 31 to bit 23, the 23 mantissa bits stay put
+    ms_bin = (ieee & 0x7fffff) | ((ieee >> 8) & 0x800000) | (ms_exp << 24)
+    ms_bin[0 == (ieee & 0x7fffffff)] = 0
+    return ms_bin
+
+
+def datetime642fmsfloat(dates) -> np.ndarray:
+    """Convert an array of dates into metastock format date floats
+
+    The vectorized inverse of fmsfloat2datetime64.
+    @param dates: An array of dates, converted to datetime64[D]
+    @return: An array of float32 holding YYYYMMDD - 19000000
+    """
+    dates = np.asarray(dates, dtype='M8[D]')
+    years = dates.astype('M8[Y]')
+    months = dates.astype('M8[M]')
+    yyyymmdd = ((years.astype(np.int64) + 1970)*10000 +
+                (months - years.astype('M8[M]')).astype(np.int64)*100 +
+                (dates - months.astype('M8[D]')).astype(np.int64) + 101)
+    return (yyyymmdd - 19000000).astype(np.float32)
+
+
+def encode_data_records(data) -> np.ndarray:
+    """Encode data into raw metastock data records
+
+    The inverse of decode_data_records.  The dates must be strictly
+    increasing, a 7 field record has no time so equal dates are duplicates.
+    @param data: A structured array like those returned by get_raw_data, or
+        a dict of field name to array.  It must have a date field; missing
+        price and volume fields are written as zero.
+    @return: A (num_records, 7) array of uint32.
+    """
+    dates = np.asarray(data['date'], dtype='M8[D]')
+    if (np.diff(dates) <= np.timedelta64(0, 'D')).any():
+        raise ValueError("Dates must be strictly increasing")
+    fields = data.dtype.names if isinstance(data, np.ndarray) else data
+    words = np.zeros(shape=(len(dates), len(DATA_DTYPE)), dtype='<u4')
+    words[:, 0] = ieee2fmsbin_array(datetime642fmsfloat(dates))
+    for col, field in enumerate(DATA_DTYPE.names[1:], start=1):
+        if field in fields:
+            words[:, col] = ieee2fmsbin_array(data[field])
+    return words
+
+
+def write_data_file(file_name, data) -> None:
+    """Write a 7 field metastock data file, replacing any existing file
+
+    @param file_name: FQ name of the data file.
+    @param data: The data to write, see encode_data_records.
+    """
+    words = encode_data_records(data)
+    if len(words) > MAX_DATA_RECORDS:
+        raise ValueError("A data file can hold at most %d records" %
+                         MAX_DATA_RECORDS)
+    with open(file_name, 'wb') as datafile:
+        datafile.write(struct.pack('<' + DATA_HEADER_FMT, len(words) + 1,
+                                   len(words) + 1))
+        datafile.write(words.tobytes())
+
+
+def append_data_file(file_name, data) -> int:
+    """Append records to an existing metastock data file
+
+    The new records are written after the last record in the header and the
+    header's lastRecord is patched; the existing records are not rewritten.
+    The new records must be dated after the last existing record.
+    @param file_name: FQ name of the data file.
+    @param data: The data to append, see encode_data_records.
+    @return: The number of records in the file after appending.
+    """
+    words = encode_data_records(data)
+    with open(file_name, 'r+b') as datafile:
+        num_records = read_data_header(datafile)
+        if num_records + len(words) > MAX_DATA_RECORDS:
+            raise ValueError("A data file can hold at most %d records" %
+                             MAX_DATA_RECORDS)
+        if num_records > 0 and len(words) > 0:
+            datafile.seek(DATA_RECORD_LEN*num_records)
+            last_date = fmsbin2ieee_array(np.frombuffer(datafile.read(4),
+                                                        dtype='<u4'))
+            if fmsbin2ieee_array(words[0, 0:1])[0] <= last_date[0]:
+                raise ValueError("Cannot append records dated on or before "
+                                 "the last record of %s" % file_name)
+        datafile.seek(DATA_RECORD_LEN*(num_records + 1))
+        datafile.write(words.tobytes())
+        datafile.seek(0)
+        datafile.write(struct.pack('<HH', num_records + len(words) + 1,
+                                   num_records + len(words) + 1))
+    return num_records + len(words)
+
+
+def _c_string(value, width, what) -> bytes:
+    """Encode a string for a fixed width, null terminated field"""
+    encoded = value.encode()
+    if len(encoded) >= width:
+        raise ValueError("%s %s is longer than %d characters" %
+                         (what, value, width - 1))
+    return encoded
+
+
+def _char(value) -> bytes:
+    """Encode a single character field, a null read back as '' included"""
+    return value.encode() or b'\x00'
+
+
+class MetastockWriter(object):
+    """
+    Writes Metastock data files and the emaster/xmaster files indexing them.
+
+    Symbols are given the lowest free file numbers.  F1 - F255 are F#.dat
+    files listed in EMASTER and higher numbers are F#.mwd files listed in
+    XMASTER, the layout ComputracDir reads.  Symbols already indexed in the
+    directory are kept and may be appended to.  The master files are
+    rewritten by flush, which is called when used as a context manager.
+    The field count and autorun flag of existing entries are written back
+    unchanged, but only 7 field files can be appended to.  The legacy MASTER
+    file is not written.
+
+    """
+
+    def __init__(self, dir_name):
+        """
+        @param dir_name: The directory to write to, created if necessary.
+        """
+        self.dir_name = dir_name
+        self._entries = {}
+        # The master files are rewritten under the names they were found
+        # with, the reader matches either case
+        self._master_names = {'EMASTER': 'EMASTER', 'XMASTER': 'XMASTER'}
+        os.makedirs(dir_name, exist_ok=True)
+        existing = ComputracDir()
+        found = set()
+        for file_name in sorted(os.listdir(dir_name)):
+            master = file_name.upper()
+            if master not in self._master_names:
+                continue
+            if master in found:
+                raise RuntimeError("More than one %s file in %s" %
+                                   (master, dir_name))
+            found.add(master)
+            self._master_names[master] = file_name
+            if 'EMASTER' == master:
+                existing.read_emaster_file(os.path.join(dir_name, file_name))
+            else:
+                existing.read_xmaster_file(os.path.join(dir_name, file_name))
+        for ticker in existing.tickers:
+            (symbol, name, first_dt, last_dt, freq, file_name, num_fld, flag,
+             master_file) = existing.get_reference_data(ticker)
+            f_num = int(re.match(r'F(\d+)\.', os.path.basename(
+                    file_name)).group(1))
+            if len(DATA_DTYPE) == num_fld:
+                last_rec = read_data_asof(file_name, '9999-12-31', ['date'])
+                if len(last_rec) > 0:
+                    last_dt = last_rec['date'][0]
+            self._entries[symbol] = [f_num, name, freq,
+                                     np.datetime64(first_dt, 'D'),
+                                     np.datetime64(last_dt, 'D'), num_fld,
+                                     flag]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+    @property
+    def tickers(self):
+        """Return all tickers in the directory"""
+        return np.sort(list(self._entries.keys()))
+
+    def file_name(self, symbol) -> str:
+        """Return the FQ name of the data file of a symbol"""
+        f_num = self._entries[symbol][0]
+        return os.path.join(self.dir_name, 'F%d.%s' % (
+                f_num, 'dat' if f_num <= EMASTER_MAX_FILES else 'mwd'))
+
+    def add(self, symbol, data, name=None, freq='D') -> str:
+        """Write the data file for a new symbol
+
+        @param symbol: The ticker
+        @param data: The data to write, see encode_data_records.
+        @param name: The asset name, the symbol if not given.
+        @param freq: The periodicity of the data, 'D', 'W', 'M' etc
+        @return: FQ name of the data file written.
+        """
+        if symbol in self._entries:
+            raise RuntimeError("Duplicate ticker %s in %s" %
+                               (symbol, self.dir_name))
+        if len(data['date']) == 0:
+            raise ValueError("No data for %s" % symbol)
+        used = set(entry[0] for entry in self._entries.values())
+        f_num = min(set(range(1, len(used) + 2)) - used)
+        if f_num > 2**16 - 1:
+            raise ValueError("No free file numbers in %s" % self.dir_name)
+        emaster = f_num <= EMASTER_MAX_FILES
+        _c_string(symbol, 21 if emaster else 15, 'Symbol')
+        _c_string(symbol if name is None else name, 53 if emaster else 32,
+                  'Name')
+        dates = np.asarray(data['date'], dtype='M8[D]')
+        self._entries[symbol] = [f_num, symbol if name is None else name,
+                                 freq, dates[0], dates[-1], len(DATA_DTYPE),
+                                 ' ']
+        try:
+            write_data_file(self.file_name(symbol), data)
+        except BaseException:
+            del self._entries[symbol]
+            raise
+        return self.file_name(symbol)
+
+    def append(self, symbol, data) -> int:
+        """Append records to the data file of a symbol
+
+        See append_data_file.
+        @param symbol: The ticker
+        @param data: The data to append, see encode_data_records.
+        @return: The number of records in the file after appending.
+        """
+        if len(DATA_DTYPE) != self._entries[symbol][5]:
+            raise ValueError("Cannot append to %s, it has %d fields not %d" %
+                             (symbol, self._entries[symbol][5],
+                              len(DATA_DTYPE)))
+        num_records = append_data_file(self.file_name(symbol), data)
+        if len(data['date']) > 0:
+            self._entries[symbol][4] = np.datetime64(data['date'][-1], 'D')
+        return num_records
+
+    def flush(self) -> None:
+        """Rewrite the EMASTER and XMASTER files"""
+        emaster, xmaster = [], []
+        for symbol, entry in sorted(self._entries.items(),
+                                    key=lambda item: item[1][0]):
+            if entry[0] <= EMASTER_MAX_FILES:
+                emaster.append((symbol,) + tuple(entry))
+            else:
+                xmaster.append((symbol,) + tuple(entry))
+        self._write_emaster(emaster)
+        if xmaster:
+            self._write_xmaster(xmaster)
+        else:
+            xmaster_name = os.path.join(self.dir_name,
+                                        self._master_names['XMASTER'])
+            if os.path.exists(xmaster_name):
+                os.remove(xmaster_name)
+
+    def _write_emaster(self, entries) -> None:
+        max_file_num = max([entry[1] for entry in entries] + [0])
+        buf = [struct.pack(EMASTER_HEADER_FMT, len(entries), max_file_num)]
+        for (symbol, f_num, name, freq, first_dt, last_dt, num_fld,
+             flag) in entries:
+            full_name = b''
+            name_bytes = name.encode()
+            if len(name_bytes) >= 28:
+                full_name = _c_string(name, 53, 'Name')
+                name_bytes = name_bytes[:27]
+            buf.append(struct.pack(
+                    EMASTER_RECORD_FMT, f_num, num_fld, _char(flag),
+                    _c_string(symbol, 21, 'Symbol'), name_bytes,
+                    _char(freq), datetime642fmsfloat(first_dt),
+                    datetime642fmsfloat(last_dt), full_name))
+        self._replace_file(self._master_names['EMASTER'], b''.join(buf))
+
+    def _write_xmaster(self, entries) -> None:
+        max_file_num = max(entry[1] for entry in entries)
+        buf = [struct.pack(XMASTER_HEADER_FMT, b'\x5d\xfe', b'XM',
+                           len(entries), len(entries), max_file_num)]
+        for (symbol, f_num, name, freq, first_dt, last_dt, num_fld,
+             flag) in entries:
+            first_int = int(datetime642fmsfloat(first_dt)) + 19000000
+            last_int = int(datetime642fmsfloat(last_dt)) + 19000000
+            buf.append(struct.pack(
+                    XMASTER_RECORD_FMT, _c_string(symbol, 15, 'Symbol'),
+                    _c_string(name, 32, 'Name'), _char(freq), f_num,
+                    first_int, first_int, first_int, last_int))
+        self._replace_file(self._master_names['XMASTER'], b''.join(buf))
+
+    def _replace_file(self, file_name, buf) -> None:
+        """Atomically replace a file in the directory"""
+        file_name = os.path.join(self.dir_name, file_name)
+        with open(file_name + '.tmp', 'wb') as master:
+            master.write(buf)
+        os.replace(file_name + '.tmp', file_name)
@@ -11,4 +11,6 @@ setup(name='pycomputrac',
       author_email='akapur@amvirk.com',
       license='GPL v2',
       packages=['pycomputrac'],
+      entry_points={'console_scripts': [
+          'pycomputrac = pycomputrac.__main__:main']},
       zip_safe=False, install_requires=['numpy', 'h5py'])
@@ -0,0 +1,58 @@
+"""Check the vectorized conversions against the scalar reference versions"""
+
+import struct
+import datetime
+import numpy as np
+import pytest
+
+from pycomputrac.computrac import (fmsbin2ieee, fmsbin2ieee_array,
+                                   fmsfloat2date, fmsfloat2datetime64)
+
+
+def scalar_bits(words) -> np.ndarray:
+    """Return the float32 bits fmsbin2ieee gives for each word"""
+    return np.array([struct.unpack('<I', struct.pack(
+            '<f', fmsbin2ieee(struct.pack('<I', word))))[0]
+                     for word in words.tolist()], dtype='<u4')
+
+
+def assert_same_bits(words) -> None:
+    """Compare fmsbin2ieee_array with fmsbin2ieee bit for bit
+
+    Any NaN matches any NaN, MBF exponent byte 1 decodes to NaNs whose
+    signalling bit depends on the conversion path.
+    """
+    expected = scalar_bits(words)
+    actual = fmsbin2ieee_array(words)
+    both_nan = np.isnan(expected.view('<f4')) & np.isnan(actual)
+    mismatch = (expected != actual.view('<u4')) & ~both_nan
+    assert not mismatch.any(), words[mismatch][:10]
+
+
+def test_fmsbin2ieee_array_random_words():
+    rng = np.random.default_rng(1)
+    assert_same_bits(rng.integers(0, 2**32, 200000, dtype=np.uint32))
+
+
+def test_fmsbin2ieee_array_every_exponent():
+    rng = np.random.default_rng(2)
+    mantissas = rng.integers(0, 2**24, 64, dtype=np.uint32)
+    mantissas[:4] = [0, 0x800000, 0x7fffff, 0xffffff]
+    exponents = np.arange(256, dtype=np.uint32)
+    assert_same_bits(((exponents[:, None] << 24) | mantissas).ravel())
+
+
+def test_fmsfloat2datetime64_matches_fmsfloat2date():
+    ms_dates = np.array([0.0, 1000101.0, 991231.0, 1240229.0, 1991231.0,
+                         1.0101e4])
+    expected = [fmsfloat2date(ms_date) for ms_date in ms_dates]
+    assert datetime.date(1900, 1, 1) == expected[0]
+    assert expected == fmsfloat2datetime64(ms_dates).tolist()
+
+
+@pytest.mark.parametrize('ms_date', [1240230.0, 1241301.0, 1240100.0])
+def test_fmsfloat2datetime64_invalid_date(ms_date):
+    with pytest.raises(ValueError):
+        fmsfloat2date(ms_date)
+    with pytest.raises(ValueError):
+        fmsfloat2datetime64([ms_date])
@@ -0,0 +1,90 @@
+"""Check DataCache refreshes grown files and falls back to full reads"""
+
+import numpy as np
+import pytest
+
+from pycomputrac.computrac import DATA_DTYPE, DataCache, read_data_file
+from pycomputrac.writer import append_data_file, write_data_file
+
+
+def make_data(num_records, first_date='2020-01-01') -> np.ndarray:
+    data = np.zeros(shape=num_records, dtype=DATA_DTYPE)
+    data['date'] = np.datetime64(first_date, 'D') + np.arange(num_records)
+    for field in DATA_DTYPE.names[1:]:
+        data[field] = np.arange(num_records) + 0.5
+    return data
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    file_name = str(tmp_path / 'F1.dat')
+    write_data_file(file_name, make_data(100))
+    return file_name
+
+
+def test_hit(data_file):
+    cache = DataCache(2**20)
+    first = cache.get(data_file)
+    assert first is cache.get(data_file)
+    assert (1, 1, 0) == (cache.misses, cache.hits, cache.refreshes)
+    assert not first.flags.writeable
+
+
+def test_grown_file_refreshed(data_file):
+    cache = DataCache(2**20)
+    cache.get(data_file)
+    append_data_file(data_file, make_data(30, '2020-06-01'))
+    data = cache.get(data_file)
+    assert (1, 0, 1) == (cache.misses, cache.hits, cache.refreshes)
+    assert read_data_file(data_file).tobytes() == data.tobytes()
+    assert 130 == len(data)
+    assert data.nbytes == cache.num_bytes
+
+
+def test_rewritten_last_record_read_again(data_file):
+    cache = DataCache(2**20)
+    cache.get(data_file)
+    data = make_data(120)
+    data['close'][99] = -1
+    write_data_file(data_file, data)
+    assert read_data_file(data_file).tobytes() == \
+        cache.get(data_file).tobytes()
+    assert (2, 0) == (cache.misses, cache.refreshes)
+
+
+@pytest.mark.parametrize('trailing_bytes', [0, 4000])
+def test_shrunk_file_read_again(data_file, trailing_bytes):
+    cache = DataCache(2**20)
+    cache.get(data_file)
+    write_data_file(data_file, make_data(50))
+    # Bytes past the header's last record must not be taken as new records
+    with open(data_file, 'ab') as datafile:
+        datafile.write(b'\x01'*trailing_bytes)
+    data = cache.get(data_file)
+    assert read_data_file(data_file).tobytes() == data.tobytes()
+    assert 50 == len(data)
+    assert (2, 0) == (cache.misses, cache.refreshes)
+
+
+def test_lru_eviction_by_bytes(tmp_path):
+    file_names = []
+    for f_num in range(1, 4):
+        file_names.append(str(tmp_path / ('F%d.dat' % f_num)))
+        write_data_file(file_names[-1], make_data(100))
+    entry_bytes = make_data(100).nbytes
+    cache = DataCache(2*entry_bytes)
+    for f_num in (0, 1, 0, 2):
+        cache.get(file_names[f_num])
+    # F2 was the least recently used when F3 was added
+    assert [file_names[0], file_names[2]] == list(cache._entries)
+    assert 2*entry_bytes == cache.num_bytes
+    cache.get(file_names[0])
+    cache.get(file_names[1])
+    assert (2, 4) == (cache.hits, cache.misses)
+    assert [file_names[0], file_names[1]] == list(cache._entries)
+
+    # A file larger than the whole cache is returned but not kept
+    write_data_file(file_names[2], make_data(300))
+    assert 300 == len(cache.get(file_names[2]))
+    assert [file_names[0], file_names[1]] == list(cache._entries)
+    assert 2*entry_bytes == cache.num_bytes
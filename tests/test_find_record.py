@@ -0,0 +1,64 @@
+"""Check the binary search of the on disk date column at its boundaries"""
+
+import numpy as np
+import pytest
+
+from pycomputrac.computrac import (DATA_DTYPE, DATA_RECORD_LEN, find_record,
+                                   find_record_range, read_data_file)
+from pycomputrac.writer import write_data_file
+
+DATES = np.array(['2020-01-02', '2020-01-03', '2020-01-06', '2020-01-08'],
+                 dtype='M8[D]')
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    data = np.zeros(shape=len(DATES), dtype=DATA_DTYPE)
+    data['date'] = DATES
+    data['close'] = np.arange(len(DATES))
+    file_name = str(tmp_path / 'F1.dat')
+    write_data_file(file_name, data)
+    return file_name
+
+
+@pytest.mark.parametrize('dt', ['2019-12-31', '2020-01-02', '2020-01-04',
+                                '2020-01-06', '2020-01-08', '2020-02-01'])
+@pytest.mark.parametrize('side', ['left', 'right'])
+def test_find_record_matches_searchsorted(data_file, dt, side):
+    with open(data_file, 'rb') as datafile:
+        assert (np.searchsorted(DATES, np.datetime64(dt, 'D'), side) ==
+                find_record(datafile, len(DATES), dt, side))
+
+
+@pytest.mark.parametrize('start, end, expected', [
+        (None, None, (0, 4)),
+        ('2020-01-02', '2020-01-08', (0, 4)),
+        ('2019-01-01', '2019-12-31', (0, 0)),
+        ('2021-01-01', None, (4, 4)),
+        (None, '2019-12-31', (0, 0)),
+        ('2020-01-04', '2020-01-05', (2, 2)),
+        ('2020-01-08', '2020-01-02', (1, 1)),
+        ('2020-01-03', '2020-01-06', (1, 3))])
+def test_find_record_range(data_file, start, end, expected):
+    with open(data_file, 'rb') as datafile:
+        assert expected == find_record_range(datafile, start, end)
+    data = read_data_file(data_file, start, end)
+    assert (DATES[expected[0]:expected[1]] == data['date']).all()
+
+
+def test_find_record_range_empty_file(tmp_path):
+    file_name = str(tmp_path / 'F1.dat')
+    write_data_file(file_name, np.zeros(shape=0, dtype=DATA_DTYPE))
+    with open(file_name, 'rb') as datafile:
+        assert (0, 0) == find_record_range(datafile, '2020-01-01',
+                                           '2020-12-31')
+    assert 0 == len(read_data_file(file_name, start='2020-01-01'))
+
+
+def test_find_record_truncated(data_file):
+    with open(data_file, 'r+b') as datafile:
+        datafile.truncate(DATA_RECORD_LEN*2)
+    for start, end in ((None, None), ('2020-01-06', None),
+                       (None, '2020-01-06')):
+        with pytest.raises(ValueError, match='truncated'):
+            read_data_file(data_file, start, end)
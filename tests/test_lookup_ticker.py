@@ -0,0 +1,28 @@
+"""Check the resolution of asset names and tickers shared by the readers"""
+
+import pytest
+
+from pycomputrac.computrac import lookup_ticker
+
+TICKERS = {'BHP': 0, 'RIO': 1, 'RIOX': 2}
+NAME_TICKERS = {'BHP Group': ['BHP'], 'Rio Tinto': ['RIO', 'RIOX'],
+                'RIO': ['RIOX']}
+
+
+@pytest.mark.parametrize('asset_id, ticker', [('BHP', 'BHP'),
+                                              ('BHP Group', 'BHP'),
+                                              ('RIO', 'RIO')])
+def test_lookup_ticker(asset_id, ticker):
+    assert ticker == lookup_ticker(asset_id, TICKERS, NAME_TICKERS)
+
+
+def test_lookup_ticker_ambiguous_name():
+    with pytest.raises(LookupError) as exc_info:
+        lookup_ticker('Rio Tinto', TICKERS, NAME_TICKERS)
+    assert ("Multiple Tickers correspond to Name Rio Tinto, Tickers: "
+            "RIO - RIOX") == str(exc_info.value)
+
+
+def test_lookup_ticker_unknown():
+    with pytest.raises(LookupError, match='NOPE'):
+        lookup_ticker('NOPE', TICKERS, NAME_TICKERS)
@@ -0,0 +1,108 @@
+"""Check that data written by pycomputrac.writer reads back exactly"""
+
+import os
+import numpy as np
+import pytest
+
+from pycomputrac import ComputracDir
+from pycomputrac.computrac import DATA_DTYPE, fmsbin2ieee_array
+from pycomputrac.writer import (MetastockWriter, append_data_file,
+                                ieee2fmsbin_array, write_data_file)
+
+
+def random_data(rng, num_records, first_date='1995-01-02') -> np.ndarray:
+    """Return random OHLCV data on strictly increasing dates"""
+    data = np.zeros(shape=num_records, dtype=DATA_DTYPE)
+    gaps = rng.integers(1, 5, num_records)
+    data['date'] = np.datetime64(first_date, 'D') + np.cumsum(gaps) - 1
+    for field in DATA_DTYPE.names[1:]:
+        data[field] = rng.normal(0, 1, num_records)*10.0**rng.integers(
+                -30, 30, num_records)
+    data['volume'][::7] = 0
+    return data
+
+
+def as_float32(data) -> np.ndarray:
+    """Return data with the price and volume fields rounded to float32"""
+    rounded = data.copy()
+    for field in DATA_DTYPE.names[1:]:
+        rounded[field] = data[field].astype(np.float32)
+    return rounded
+
+
+def test_round_trip(tmp_path):
+    rng = np.random.default_rng(3)
+    data = random_data(rng, 3000)
+    head, tail = data[:2500], data[2500:]
+    with MetastockWriter(str(tmp_path)) as writer:
+        writer.add('AAA', head, name='A long asset name over 27 chars')
+        writer.add('BBB', data)
+        writer.append('AAA', tail[:200])
+    append_data_file(writer.file_name('AAA'), tail[200:])
+
+    computrac_dir = ComputracDir(str(tmp_path))
+    assert ['AAA', 'BBB'] == computrac_dir.tickers.tolist()
+    expected = as_float32(data).tobytes()
+    assert expected == computrac_dir.get_raw_data('AAA').tobytes()
+    assert expected == computrac_dir.get_raw_data('BBB').tobytes()
+    assert 'A long asset name over 27 chars' == \
+        computrac_dir.get_reference_data('AAA')[1]
+
+
+def test_append_rejects_old_and_duplicate_dates(tmp_path):
+    rng = np.random.default_rng(4)
+    data = random_data(rng, 20)
+    file_name = str(tmp_path / 'F1.dat')
+    write_data_file(file_name, data)
+    size = os.path.getsize(file_name)
+    for bad in (data[-1:], data[-2:-1]):
+        with pytest.raises(ValueError):
+            append_data_file(file_name, bad)
+    with pytest.raises(ValueError):
+        write_data_file(str(tmp_path / 'F2.dat'), data[[0, 0]])
+    assert size == os.path.getsize(file_name)
+
+
+def test_lowercase_master_file_rewritten(tmp_path):
+    rng = np.random.default_rng(5)
+    with MetastockWriter(str(tmp_path)) as writer:
+        writer.add('AAA', random_data(rng, 5))
+    os.rename(str(tmp_path / 'EMASTER'), str(tmp_path / 'emaster'))
+    with MetastockWriter(str(tmp_path)) as writer:
+        writer.add('BBB', random_data(rng, 5))
+    assert 'EMASTER' not in os.listdir(str(tmp_path))
+    assert ['AAA', 'BBB'] == ComputracDir(str(tmp_path)).tickers.tolist()
+
+
+def test_vendor_fields_and_flag_kept(tmp_path):
+    rng = np.random.default_rng(7)
+    with MetastockWriter(str(tmp_path)) as writer:
+        writer.add('AAA', random_data(rng, 5))
+    # Mark AAA as a 5 field autorun file, as a vendor might
+    emaster_name = str(tmp_path / 'EMASTER')
+    with open(emaster_name, 'r+b') as emaster:
+        emaster.seek(192 + 6)
+        emaster.write(bytes([5, 0, 0, ord('*')]))
+    with MetastockWriter(str(tmp_path)) as writer:
+        writer.add('BBB', random_data(rng, 5))
+        with pytest.raises(ValueError):
+            writer.append('AAA', random_data(rng, 1, '2030-01-01'))
+    computrac_dir = ComputracDir(str(tmp_path))
+    assert (5, '*') == computrac_dir.get_reference_data('AAA')[6:8]
+    assert (7, ' ') == computrac_dir.get_reference_data('BBB')[6:8]
+
+
+@pytest.mark.parametrize('value', [np.inf, -np.inf, np.nan, 2.0**127,
+                                   -2.0**127, 1e39])
+def test_ieee2fmsbin_array_unrepresentable(value):
+    with pytest.raises(ValueError):
+        ieee2fmsbin_array([1.0, value])
+
+
+def test_ieee2fmsbin_array_inverts_fmsbin2ieee_array():
+    rng = np.random.default_rng(6)
+    values = rng.integers(0, 2**32, 200000, dtype=np.uint32).view('<f4')
+    values = values[np.isfinite(values) & (np.abs(values) < 2.0**127)]
+    values = np.concatenate([values, np.float32([0.0, -0.0, 1e-45, 2**126,
+                                                 np.finfo('f4').tiny])])
+    assert (fmsbin2ieee_array(ieee2fmsbin_array(values)) == values).all()